@@ -0,0 +1,46 @@
+# aggregation.py
+from functools import lru_cache
+import numpy as np
+from combination import combination_count, get_combination_index
+
+# 把各投注類型每個組合的投注額分攤到馬匹上 (k 匹馬的組合每匹分得 1/k)
+# 所有投注類型串接成一個向量, 以一次 np.bincount (scatter-add) 得出 (投注類型 x 馬匹) 矩陣
+class AggregationPlan:
+    def __init__(self, methods, field_size):
+        self.methods = tuple(methods)
+        self.field_size = field_size
+        self.lengths = []
+        rows, bins, shares = [], [], []
+        offset = 0
+        for i, method in enumerate(self.methods):
+            runners = get_combination_index(method, field_size).runners
+            n_comb, size = runners.shape
+            rows.append(np.repeat(np.arange(offset, offset + n_comb), size))
+            bins.append(i * field_size + runners.ravel().astype(np.intp) - 1)
+            shares.append(np.full(n_comb * size, 1.0 / size))
+            self.lengths.append(n_comb)
+            offset += n_comb
+        self.size = offset
+        self.rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.intp)
+        self.bins = np.concatenate(bins) if bins else np.empty(0, dtype=np.intp)
+        self.shares = np.concatenate(shares) if shares else np.empty(0)
+
+    def per_horse(self, vectors):
+        # vectors: 每個投注類型一條按組合索引排列的密集陣列, nan 當作 0
+        values = np.nan_to_num(np.concatenate([np.asarray(vector, dtype=np.float64) for vector in vectors]), posinf=0.0)
+        weights = values[self.rows] * self.shares
+        totals = np.bincount(self.bins, weights=weights, minlength=len(self.methods) * self.field_size)
+        return totals.reshape(len(self.methods), self.field_size)
+
+@lru_cache(maxsize=64)
+def get_aggregation_plan(methods, field_size):
+    return AggregationPlan(methods, field_size)
+
+def aggregate_per_horse(latest, field_size):
+    # latest: {method: 密集陣列}; 返回 (methods, 每匹馬的投注額矩陣)
+    methods = tuple(method for method, vector in latest.items()
+                    if len(vector) == combination_count(method, field_size))
+    if not methods:
+        return methods, np.zeros((0, field_size))
+    plan = get_aggregation_plan(methods, field_size)
+    return methods, plan.per_horse([latest[method] for method in methods])
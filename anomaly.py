@@ -0,0 +1,53 @@
+# anomaly.py
+from collections import namedtuple
+import numpy as np
+from aggregation import get_aggregation_plan
+from combination import combination_count, get_combination_index
+from config import BENCHMARK_DICT
+
+# 異常投注偵測: 以上一個 tick 的賠率及今次的投注池總額估算每個組合「應有」的投注額,
+# 與今次賠率估算的投注額相減, 差額即賠率變動以外多出的投注 (千元)
+# 所有投注池串接成一個向量一次計算, 再以 AggregationPlan 分攤到每匹馬;
+# 上一個 tick 的賠率直接取自 odds_dict 的最後一行, 不需重新掃描歷史
+Alert = namedtuple("Alert", ["time", "race", "pool", "horse", "amount", "benchmark"])
+
+def diff_methods(methodlist, benchmarks=BENCHMARK_DICT):
+    return [method for method in methodlist if method in benchmarks]
+
+def detect_anomalies(time_now, race_no, odds, investments, odds_dict, diff_dict, benchmarks=BENCHMARK_DICT):
+    # 必須在 save_odds_data 之前呼叫; 每匹馬的差額寫入 diff_dict, 返回超過基準值的 Alert
+    field_size = len(odds.get("WIN", []))
+    if not field_size:
+        return []
+    methods = tuple(
+        method for method in diff_methods(diff_dict, benchmarks)
+        if investments.get(method) and len(odds.get(method, [])) == combination_count(method, field_size)
+    )
+    if not methods:
+        return []
+    plan = get_aggregation_plan(methods, field_size)
+    # 先轉為歷史紀錄的精度 (float32), 賠率不變時與上一行完全相同
+    current = [np.asarray(odds[method], dtype=odds_dict[method].dtype).astype(np.float64) for method in methods]
+    # 上一行按當前組合索引重新排列 (馬匹數目改變後合併的欄位次序不同);
+    # 第一個 tick 沒有可比較的賠率, 差額為 0; 新增的組合沒有上一個賠率 (nan), 分攤時當作 0
+    previous = np.concatenate([
+        odds_dict[method].last_for(get_combination_index(method, field_size).columns) if not odds_dict[method].empty else vector
+        for method, vector in zip(methods, current)
+    ])
+    current = np.concatenate(current)
+    totals = np.repeat([investments[method][0] for method in methods], plan.lengths)
+    # 退出馬匹的賠率為 inf, 1/inf 為 0; 缺少的賠率為 nan, 分攤時當作 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        diff = totals * 0.825 / 1000 * (1 / current - 1 / previous)
+    per_horse = np.round(plan.per_horse([diff]), 0)
+    horses = np.arange(1, field_size + 1)
+    for method, row in zip(methods, per_horse):
+        diff_dict[method].append(time_now, row, horses)
+    diff_dict["overall"].append(time_now, per_horse.sum(axis=0), horses)
+
+    thresholds = np.array([benchmarks[method] for method in methods], dtype=np.float64)
+    rows, cols = np.nonzero(per_horse > thresholds[:, None])
+    return [
+        Alert(time_now, race_no, methods[row], int(col) + 1, float(per_horse[row, col]), float(thresholds[row]))
+        for row, col in zip(rows, cols)
+    ]
@@ -0,0 +1,298 @@
+# archive.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from history_store import HistoryStore
+from combination import plain_label
+from anomaly import Alert, diff_methods
+from fair_value import fair_methods
+from movers import top_movers
+from scheduler import mark_cutoffs
+from retention import RetentionPolicy
+from race_cache import race_cache
+from config import ALERT_HISTORY
+
+# 本地只追加的快照存檔 (SQLite)
+# 每行為一個 (日期, 場地, 場次, 歷史類型, 投注類型, 時間) 的快照, 數值以 float64 blob 按欄保存,
+# 欄位標籤另存一次並以 id 引用; 寫入先緩衝, 每個收集週期一次過提交
+# 與同一序列上一行相同的行 (沒有更新的投注池) 只寫入空的 blob 作為重複標記, 讀取時重複上一行
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (
+    id INTEGER PRIMARY KEY,
+    labels TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    date TEXT NOT NULL,
+    venue TEXT NOT NULL,
+    race INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    pool TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    label_id INTEGER NOT NULL REFERENCES labels(id),
+    "values" BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_series ON snapshots (date, venue, race, kind, pool, ts);
+CREATE TABLE IF NOT EXISTS alerts (
+    date TEXT NOT NULL,
+    venue TEXT NOT NULL,
+    race INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    pool TEXT NOT NULL,
+    horse INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    benchmark REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alerts_race ON alerts (date, venue, race, ts);
+"""
+
+HISTORY_KINDS = {"odds": "odds_dict", "investment": "investment_dict", "overall": "overall_investment_dict", "diff": "diff_dict", "fair": "fair_dict"}
+# 這些類型的 HistoryStore 保存累計和 (圖表按窗口加總)
+CUMULATIVE_KINDS = {"diff"}
+REPEAT_ROW = b""
+
+def _timestamp(time_now):
+    return int(np.datetime64(time_now, "ns").astype(np.int64))
+
+class SnapshotArchive:
+    def __init__(self, path, batch_size=500, mmap_size=256 * 1024 * 1024):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        # 收集程序及 Streamlit 檢視器可同時開啟同一個檔案, 寫入時互相等待
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # 讀取經 mmap, 重新載入歷史不需逐頁複製
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        self._conn.executescript(SCHEMA)
+        self._buffer = []
+        self._alert_buffer = []
+        self._label_ids = {}
+        self._labels = {}
+        # 每個序列上一次寫入的欄位標籤 id, 只在欄位相同時寫入重複標記
+        self._series_labels = {}
+
+    def _label_id(self, columns):
+        cached = self._label_ids.get(id(columns))
+        if cached is not None and cached[0] is columns:
+            return cached[1]
+        text = json.dumps([plain_label(label) for label in columns])
+        row = self._conn.execute("SELECT id FROM labels WHERE labels = ?", (text,)).fetchone()
+        if row is None:
+            label_id = self._conn.execute("INSERT INTO labels (labels) VALUES (?)", (text,)).lastrowid
+        else:
+            label_id = row[0]
+        self._label_ids[id(columns)] = (columns, label_id)
+        return label_id
+
+    def _columns(self, label_id):
+        if label_id not in self._labels:
+            text = self._conn.execute("SELECT labels FROM labels WHERE id = ?", (label_id,)).fetchone()[0]
+            self._labels[label_id] = pd.Index(json.loads(text))
+        return self._labels[label_id]
+
+    def record(self, date, venue, race, kind, pool, time_now, row, columns, repeat=False):
+        # repeat: row 與這個序列上一次寫入的行相同
+        with self._lock:
+            series = (str(date), venue, int(race), kind, pool)
+            label_id = self._label_id(columns)
+            repeat = repeat and self._series_labels.get(series) == label_id
+            self._series_labels[series] = label_id
+            self._buffer.append((
+                *series,
+                _timestamp(time_now),
+                label_id,
+                REPEAT_ROW if repeat else np.ascontiguousarray(row, dtype=np.float64).tobytes(),
+            ))
+            if len(self._buffer) >= self.batch_size:
+                self._flush_locked()
+
+    def record_race(self, date, venue, race, history, time_now):
+        # 把一場賽事在 time_now 新增的每一行寫入緩衝; 與上一行相同的只寫入重複標記
+        stamp = np.datetime64(time_now, "ns")
+        for kind, key in HISTORY_KINDS.items():
+            for pool, store in history[key].items():
+                if not store.empty and store.last_time() == stamp:
+                    repeat = len(store) > 1 and np.array_equal(store.last(), store.row_ago(1), equal_nan=True)
+                    self.record(date, venue, race, kind, pool, time_now, store.last(), store.columns, repeat)
+
+    def record_alerts(self, date, venue, alerts):
+        with self._lock:
+            self._alert_buffer.extend(
+                (str(date), venue, int(alert.race), _timestamp(alert.time), alert.pool, alert.horse, alert.amount, alert.benchmark)
+                for alert in alerts
+            )
+
+    def _flush_locked(self):
+        if not self._buffer and not self._alert_buffer:
+            return
+        with self._conn:
+            self._conn.executemany(
+                'INSERT INTO snapshots (date, venue, race, kind, pool, ts, label_id, "values") VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                self._buffer,
+            )
+            self._conn.executemany(
+                "INSERT INTO alerts (date, venue, race, ts, pool, horse, amount, benchmark) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self._alert_buffer,
+            )
+        self._buffer = []
+        self._alert_buffer = []
+
+    def flush(self):
+        with self._lock:
+            try:
+                self._flush_locked()
+            except sqlite3.Error as e:
+                logging.error(f"Error writing snapshot archive {self.path}: {e}")
+
+    def races(self, date, venue):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT race FROM snapshots WHERE date = ? AND venue = ? ORDER BY race", (str(date), venue)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def load_store(self, date, venue, race, kind, pool):
+        # 逐行讀出並追加到新的 HistoryStore, 游標是惰性的, 不會一次建立整個結果集
+        with self._lock:
+            self._flush_locked()
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM snapshots WHERE date = ? AND venue = ? AND race = ? AND kind = ? AND pool = ?",
+                (str(date), venue, int(race), kind, pool),
+            ).fetchone()[0]
+        store = HistoryStore(capacity=max(count, 1), cumulative=kind in CUMULATIVE_KINDS)
+        self.extend_store(store, date, venue, race, kind, pool)
+        return store
+
+    def extend_store(self, store, date, venue, race, kind, pool):
+        # 只讀取比 store 最後一行更新的快照, 返回新增的行數
+        since = int(store.last_time().astype(np.int64)) if not store.empty else -1
+        added = 0
+        with self._lock:
+            cursor = self._conn.execute(
+                'SELECT ts, label_id, "values" FROM snapshots WHERE date = ? AND venue = ? AND race = ? AND kind = ? AND pool = ? AND ts > ? ORDER BY ts',
+                (str(date), venue, int(race), kind, pool, since),
+            )
+            for ts, label_id, values in cursor:
+                if values == REPEAT_ROW:
+                    if store.empty:
+                        continue
+                    store.repeat_last(np.datetime64(ts, "ns"))
+                else:
+                    store.append(np.datetime64(ts, "ns"), np.frombuffer(values, dtype=np.float64), self._columns(label_id))
+                added += 1
+        return added
+
+    def load_alerts(self, date, venue, race, since=None):
+        # since: 只讀取此時間之後的警報
+        since = _timestamp(since) if since is not None else -1
+        with self._lock:
+            self._flush_locked()
+            rows = self._conn.execute(
+                "SELECT ts, race, pool, horse, amount, benchmark FROM alerts WHERE date = ? AND venue = ? AND race = ? AND ts > ? ORDER BY ts",
+                (str(date), venue, int(race), since),
+            ).fetchall()
+        return [Alert(pd.Timestamp(ts).to_pydatetime(), race, pool, horse, amount, benchmark)
+                for ts, race, pool, horse, amount, benchmark in rows]
+
+    def load_race_history(self, date, venue, race, methodlist):
+        pools = {
+            "overall": list(methodlist) + ["overall"],
+            "diff": diff_methods(methodlist) + ["overall"],
+            "fair": fair_methods(methodlist) + ["overround"],
+        }
+        return {
+            key: {pool: self.load_store(date, venue, race, kind, pool) for pool in pools.get(kind, methodlist)}
+            for kind, key in HISTORY_KINDS.items()
+        }
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+# 唯讀檢視器: 數據由獨立的 collector_daemon.py 寫入存檔, Streamlit 只按需增量讀取
+# 介面與 collector.MeetingCollector 相同, app 不需要分辨兩種模式
+class ArchiveViewer:
+    def __init__(self, archive, Date, place, methodlist):
+        self.archive = archive
+        self.Date = Date
+        self.place = place
+        self.methodlist = methodlist
+        self.race_history = {}
+        self.race_alerts = {}
+        self.post_times = {}
+        self.retention = RetentionPolicy()
+        self.last_tick = None
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def set_races(self, race_nos, post_time_dict=None):
+        if post_time_dict is not None:
+            self.post_times = dict(post_time_dict)
+
+    def ensure_running(self):
+        pass
+
+    def race_finished(self, race_no):
+        # 投注池狀態只在收集程序內, 檢視器一直跟隨刷新
+        return False
+
+    def release(self, race_no):
+        # 由 race_cache 呼叫, 再次觀看時從存檔重新載入; 正在讀取存檔時拒絕而不等待鎖
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            return self.race_history.pop(race_no, None) is not None
+        finally:
+            self._lock.release()
+
+    def alerts(self, race_no):
+        # 只讀取上次之後的新警報
+        with self._lock:
+            alerts = self.race_alerts.setdefault(race_no, deque(maxlen=ALERT_HISTORY))
+            try:
+                alerts.extend(self.archive.load_alerts(self.Date, self.place, race_no, alerts[-1].time if alerts else None))
+            except sqlite3.Error as e:
+                logging.error(f"Error reading alerts from {self.archive.path}: {e}")
+            return list(alerts)
+
+    def movers(self, race_no):
+        # 由已載入的歷史計算 (每次只比較最後一行與之前的一行)
+        with self._lock:
+            history = self.race_history.get(race_no)
+            return top_movers(history, self.methodlist) if history is not None else []
+
+    def snapshot(self, race_no):
+        with self._lock:
+            try:
+                history = self.race_history.get(race_no)
+                if history is None:
+                    history = self.race_history[race_no] = self.archive.load_race_history(self.Date, self.place, race_no, self.methodlist)
+                else:
+                    for kind, key in HISTORY_KINDS.items():
+                        for pool, store in history[key].items():
+                            self.archive.extend_store(store, self.Date, self.place, race_no, kind, pool)
+                mark_cutoffs(history, self.post_times.get(race_no))
+                self.retention.trim(self.race_history, datetime.now() + timedelta(hours=8), self.post_times, self.race_finished)
+                self.last_error = None
+            except sqlite3.Error as e:
+                logging.error(f"Error reading snapshot archive {self.archive.path}: {e}")
+                self.last_error = e
+                if history is None:
+                    return None
+            overall = history["overall_investment_dict"]["overall"]
+            if not overall.empty:
+                self.last_tick = pd.Timestamp(overall.last_time()).to_pydatetime()
+            snapshot = {key: {pool: store.snapshot() for pool, store in history[key].items()} for key in HISTORY_KINDS.values()}
+        race_cache.touch((self.Date, self.place, race_no), self)
+        return snapshot
@@ -0,0 +1,125 @@
+# benchmark.py
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from anomaly import detect_anomalies
+from collector import new_race_history
+from data_fetch import _parse_investment_data, _parse_odds_data
+from http_client import loads_json
+from data_process import save_odds_data, save_investment_data, get_overall_investment
+from fair_value import save_fair_values
+from synthetic_race import SyntheticRace
+from scheduler import chart_cutoffs, mark_cutoffs
+from visualization import chart_data, chart_spec
+from config import METHOD_LIST_WITH_QPL, PRINT_LIST_WITH_QPL
+
+# 以合成賽事量度每個處理階段的耗時 (每個 tick 及整個賽事), 輸出 JSON 方便追蹤退步
+STAGES = ["decode", "extract", "anomaly", "save", "fair_value", "aggregate", "chart"]
+
+def _summary(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "max_ms": float(samples.max()),
+        "total_ms": float(samples.sum()),
+    }
+
+def bench_meeting(runners, ticks, scratched=(), methodlist=METHOD_LIST_WITH_QPL, seed=0):
+    race = SyntheticRace(runners=runners, scratched=scratched, seed=seed)
+    history = new_race_history(methodlist)
+    # 開跑時間設在最後一個 tick 之後, 使 25 分鐘及 5 分鐘時間點都在模擬範圍內
+    start = datetime(2025, 1, 1, 12, 0)
+    post_time = start + timedelta(minutes=ticks)
+    time_25_minutes_before, time_5_minutes_before = chart_cutoffs(post_time)
+    mark_cutoffs(history, post_time)
+    names = [f"{horse}. 馬{horse}" for horse in range(1, runners + 1)]
+    timings = {stage: [] for stage in STAGES}
+    payload_bytes = []
+    for tick in range(ticks):
+        time_now = start + timedelta(minutes=tick)
+        odds_bytes, investment_bytes = race.encoded(methodlist)
+        payload_bytes.append(len(odds_bytes) + len(investment_bytes))
+
+        started = time.perf_counter()
+        odds_data = loads_json(odds_bytes)
+        investment_data = loads_json(investment_bytes)
+        timings["decode"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        odds = _parse_odds_data(odds_data, race.venue)
+        investments = _parse_investment_data(investment_data, race.venue)
+        timings["extract"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        detect_anomalies(time_now, race.race_no, odds, investments, history["odds_dict"], history["diff_dict"])
+        timings["anomaly"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        save_odds_data(time_now, odds, history["odds_dict"])
+        save_investment_data(time_now, investments, odds, history["investment_dict"])
+        timings["save"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        save_fair_values(time_now, odds, history["fair_dict"])
+        timings["fair_value"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        get_overall_investment(time_now, history["investment_dict"], history["overall_investment_dict"], methodlist)
+        timings["aggregate"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for method in PRINT_LIST_WITH_QPL:
+            prepared = chart_data(
+                history["overall_investment_dict"][method], history["odds_dict"].get(method),
+                history["diff_dict"].get(method), method, time_25_minutes_before, time_5_minutes_before, names,
+            )
+            if prepared is not None:
+                chart_spec(*prepared, method)
+        timings["chart"].append(time.perf_counter() - started)
+
+        race.advance()
+    tick_totals = np.sum([timings[stage] for stage in STAGES], axis=0)
+    return {
+        "runners": runners,
+        "scratched": sorted(scratched),
+        "ticks": ticks,
+        "combinations": {method: int(history["odds_dict"][method].values.shape[1]) for method in methodlist},
+        "payload_bytes_mean": float(np.mean(payload_bytes)),
+        "stages": {stage: _summary(timings[stage]) for stage in STAGES},
+        "tick": _summary(tick_totals),
+        "meeting_total_ms": float(tick_totals.sum() * 1000),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the odds/investment pipeline on synthetic races")
+    parser.add_argument("--runners", type=int, nargs="+", default=[6, 8, 10, 12, 14])
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--scratched", type=int, nargs="*", default=[2], help="退出馬匹號碼")
+    parser.add_argument("--out", help="把結果寫入 JSON 檔案 (預設輸出到 stdout)")
+    args = parser.parse_args(argv)
+
+    results = {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "results": [
+            bench_meeting(runners, args.ticks, [horse for horse in args.scratched if horse <= runners])
+            for runners in args.runners
+        ],
+    }
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# collector.py
+import logging
+import threading
+import time
+from collections import deque
+import numpy as np
+from datetime import datetime
+from dateutil import relativedelta as datere
+from data_fetch import get_meeting_investments, get_meeting_odds
+from data_process import save_odds_data, save_investment_data, get_overall_investment
+from anomaly import detect_anomalies, diff_methods
+from fair_value import fair_methods, save_fair_values
+from movers import top_movers
+from history_store import new_history_dict
+from pool_state import RacePoolState
+from scheduler import PollScheduler, mark_cutoffs
+from retention import RetentionPolicy
+from race_cache import race_cache
+from metrics import metrics, record_history_sizes
+from config import COLLECT_IDLE_TIMEOUT, ALERT_HISTORY
+
+HISTORY_KEYS = ["odds_dict", "investment_dict", "overall_investment_dict", "diff_dict", "fair_dict"]
+
+def new_race_history(methodlist):
+    return {
+        "odds_dict": new_history_dict(methodlist),
+        "investment_dict": new_history_dict(methodlist),
+        "overall_investment_dict": new_history_dict(list(methodlist) + ["overall"]),
+        "diff_dict": new_history_dict(diff_methods(methodlist) + ["overall"], cumulative=True),
+        "fair_dict": new_history_dict(fair_methods(methodlist) + ["overround"]),
+    }
+
+def repeat_last_tick(time_now, history):
+    # 沒有投注池更新時, 以上一行記錄這個 tick, 不重新計算; 投注變動為 0
+    for key in HISTORY_KEYS:
+        for store in history[key].values():
+            if store.empty:
+                continue
+            if key == "diff_dict":
+                store.append(time_now, np.zeros(len(store.columns)), store.columns)
+            else:
+                store.repeat_last(time_now)
+
+def collect_meeting(time_now, Date, place, race_nos, methodlist, race_history, archive=None, pool_states=None, alerts=None,
+                    movers=None):
+    # 每個週期抓取全場所有場次, 分別寫入各自的歷史紀錄; 返回成功更新的場次
+    # 有 archive 時, 新增的快照會一併寫入本地存檔 (每個週期一次批量提交)
+    # pool_states 保存每場每個投注池的 lastUpdateTime, 只重新抓取有變動的投注池賠率
+    # alerts: {race_no: deque}, 偵測到的異常投注會追加到該場 (只保留最近 ALERT_HISTORY 個)
+    # movers: {race_no: [Mover]}, 每個更新的場次重新選出熱門組合
+    if pool_states is None:
+        pool_states = {}
+    active = [race_no for race_no in race_nos if not pool_states.setdefault(race_no, RacePoolState()).finished]
+    if not active:
+        return []
+    investments_by_race, states_by_race = get_meeting_investments(Date, place, active, methodlist)
+    odds_requests = {}
+    for race_no in active:
+        changed = pool_states[race_no].changed_methods(states_by_race.get(race_no, {}), methodlist)
+        if changed:
+            odds_requests[race_no] = changed
+    odds_by_race = get_meeting_odds(
+        Date, place, odds_requests, {race_no: pool_states[race_no].field_size for race_no in odds_requests}
+    )
+    updated = []
+    for race_no in active:
+        investments = investments_by_race.get(race_no, {})
+        if not investments.get("WIN"):
+            continue
+        state = pool_states[race_no]
+        try:
+            if race_no in odds_requests:
+                odds = state.merge_odds(odds_by_race.get(race_no), odds_requests[race_no])
+                if not len(odds.get("WIN", [])):
+                    continue
+                history = race_history.setdefault(race_no, new_race_history(methodlist))
+                with metrics.timer("anomaly", race=race_no):
+                    race_alerts = detect_anomalies(time_now, race_no, odds, investments, history["odds_dict"], history["diff_dict"])
+                if race_alerts:
+                    if alerts is not None:
+                        alerts.setdefault(race_no, deque(maxlen=ALERT_HISTORY)).extend(race_alerts)
+                    if archive is not None:
+                        archive.record_alerts(Date, place, race_alerts)
+                with metrics.timer("save", race=race_no):
+                    save_odds_data(time_now, odds, history["odds_dict"])
+                    save_investment_data(time_now, investments, odds, history["investment_dict"])
+                with metrics.timer("fair_value", race=race_no):
+                    save_fair_values(time_now, odds, history["fair_dict"])
+                with metrics.timer("aggregate", race=race_no):
+                    get_overall_investment(time_now, history["investment_dict"], history["overall_investment_dict"], methodlist)
+            else:
+                history = race_history.get(race_no)
+                if history is None or history["odds_dict"]["WIN"].empty:
+                    continue
+                repeat_last_tick(time_now, history)
+            if movers is not None:
+                with metrics.timer("movers", race=race_no):
+                    movers[race_no] = top_movers(history, methodlist)
+            updated.append(race_no)
+        except Exception as e:
+            logging.error(f"Error processing race {race_no} at {time_now}: {e}")
+            continue
+        record_history_sizes(race_no, history)
+        if archive is not None:
+            with metrics.timer("archive", race=race_no):
+                archive.record_race(Date, place, race_no, history, time_now)
+    if archive is not None:
+        with metrics.timer("archive", race="all"):
+            archive.flush()
+    return updated
+
+# 全場共用的背景收集器: 每個 (日期, 場地) 只有一個, 由所有瀏覽器 session 共用
+# 收集器擁有抓取及歷史紀錄, session 只讀取輕量的快照, 觀看人數增加時 API 請求及記憶體不變
+# 輪詢間隔由 PollScheduler 按開跑時間決定; 指定 interval 則固定間隔
+class MeetingCollector:
+    def __init__(self, Date, place, methodlist, archive=None, interval=None, idle_timeout=COLLECT_IDLE_TIMEOUT, feed=None):
+        self.Date = Date
+        self.place = place
+        self.methodlist = methodlist
+        self.archive = archive
+        self.feed = feed
+        self.scheduler = PollScheduler.fixed(interval) if interval else PollScheduler()
+        self.retention = RetentionPolicy()
+        self.idle_timeout = idle_timeout
+        self.race_nos = []
+        self.race_history = {}
+        self.pool_states = {}
+        self.race_alerts = {}
+        self.race_movers = {}
+        self.last_tick = None
+        self.last_error = None
+        self._lock = threading.RLock()
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_read = time.time()
+        self._last_tick_at = 0.0
+        self._next_delay = 0.0
+        # 存檔中的場次 (之前收集或已被 race_cache 釋放) 在觀看或繼續收集時才載入
+        self._spilled = set()
+        if archive is not None:
+            for race_no in archive.races(Date, place):
+                self._spilled.add(race_no)
+                self.race_alerts[race_no] = deque(archive.load_alerts(Date, place, race_no), maxlen=ALERT_HISTORY)
+
+    def _cache_key(self, race_no):
+        return (str(self.Date), self.place, race_no)
+
+    def _history(self, race_no):
+        # 記憶體中的歷史紀錄, 已釋放的從存檔重新載入; 呼叫者須持有 self._lock
+        history = self.race_history.get(race_no)
+        if history is None and race_no in self._spilled:
+            history = self.archive.load_race_history(self.Date, self.place, race_no, self.methodlist)
+            mark_cutoffs(history, self.scheduler.post_times.get(race_no))
+            self.race_history[race_no] = history
+            self._spilled.discard(race_no)
+        return history
+
+    def release(self, race_no):
+        # 由 race_cache 呼叫: 已完結或不再收集的場次釋放記憶體, 數據已在存檔
+        # 不等待鎖: 其他執行緒正在使用這個收集器時拒絕, 由 race_cache 改為釋放其他場次
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self.archive is None or race_no not in self.race_history:
+                return False
+            if race_no in self.race_nos and not self.race_finished(race_no):
+                return False
+            self.archive.flush()
+            del self.race_history[race_no]
+            self._spilled.add(race_no)
+            return True
+        finally:
+            self._lock.release()
+
+    def set_races(self, race_nos, post_time_dict=None):
+        with self._lock:
+            if post_time_dict is not None:
+                self.scheduler.set_post_times(post_time_dict)
+            if list(race_nos) != self.race_nos:
+                self.race_nos = list(race_nos)
+                self._wake.set()
+
+    def active_races(self):
+        return [race_no for race_no in self.race_nos if not self.race_finished(race_no)]
+
+    def next_delay(self):
+        # 距離下一次收集的秒數
+        return max(self._next_delay - (time.time() - self._last_tick_at), 0)
+
+    def ensure_running(self):
+        self._last_read = time.time()
+        # 只用 _start_lock 避免重複啟動; 第一次收集期間不持有 self._lock, 讀取快照及 race_cache 釋放不會被網絡請求阻塞
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                # 第一次在當前 rerun 同步收集, 頁面立即有數據
+                if self.last_tick is None:
+                    self.tick()
+                self._thread = threading.Thread(target=self._run, name=f"collector-{self.Date}-{self.place}", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # 沒有 session 讀取超過 idle_timeout 秒, 或所有投注池已關閉便停止, 下次讀取時再啟動
+        while time.time() - self._last_read < self.idle_timeout and not self.finished:
+            remaining = self.next_delay()
+            if remaining > 0 and not self._wake.wait(remaining):
+                continue
+            self._wake.clear()
+            self.tick()
+
+    def tick(self):
+        time_now = datetime.now() + datere.relativedelta(hours=8)
+        self._last_tick_at = time.time()
+        with self._lock:
+            race_nos = list(self.race_nos)
+            # 繼續收集已釋放的場次前先載入, 異常偵測需要上一個 tick 的賠率
+            for race_no in race_nos:
+                if race_no in self._spilled and not self.race_finished(race_no):
+                    self._history(race_no)
+        if not race_nos:
+            return []
+        try:
+            with metrics.timer("tick", venue=self.place):
+                updated = collect_meeting(
+                    time_now, self.Date, self.place, race_nos, self.methodlist,
+                    self.race_history, self.archive, self.pool_states, self.race_alerts, self.race_movers,
+                )
+            self.last_tick = time_now
+            self.last_error = None
+        except Exception as e:
+            logging.error(f"Error collecting {self.Date} {self.place}: {e}")
+            self.last_error = e
+            updated = []
+        if self.feed is not None:
+            for race_no in updated:
+                # 剛完結的場次可能已被 race_cache 釋放
+                history = self.race_history.get(race_no)
+                if history is None:
+                    continue
+                with metrics.timer("feed", race=race_no):
+                    self.feed.publish_race(self.Date, self.place, race_no, history, time_now)
+        for race_no in list(self.race_history):
+            race_cache.add(self._cache_key(race_no), self)
+        with self._lock:
+            # 更新每場圖表時間點 (開跑前 25/5 分鐘) 的位置, 開跑時間可能已改變
+            for race_no, history in list(self.race_history.items()):
+                mark_cutoffs(history, self.scheduler.post_times.get(race_no))
+            # 降採樣遠離開跑的舊行, 超出記憶體上限時清走已完結的場次;
+            # 持有鎖, race_cache 不會在期間釋放場次
+            self.retention.trim(self.race_history, time_now, self.scheduler.post_times, self.race_finished)
+        active = self.active_races()
+        # 仍有場次在售卻沒有任何場次更新, 視為抓取失敗並退避
+        if updated or not active:
+            self.scheduler.record_success()
+        else:
+            self.scheduler.record_error()
+        self._next_delay = self.scheduler.next_delay(time_now, active)
+        return updated
+
+    def race_finished(self, race_no):
+        state = self.pool_states.get(race_no)
+        return state is not None and state.finished
+
+    @property
+    def finished(self):
+        # 所有場次的投注池都已停止投注
+        return bool(self.race_nos) and all(self.race_finished(race_no) for race_no in self.race_nos)
+
+    def alerts(self, race_no):
+        # 該場最近的異常投注 (由舊到新)
+        return list(self.race_alerts.get(race_no, ()))
+
+    def movers(self, race_no):
+        # 該場最近一個 tick 的熱門組合
+        return self.race_movers.get(race_no, [])
+
+    def snapshot(self, race_no):
+        # 返回該場歷史紀錄的唯讀視圖 (共用底層陣列, 不複製數據)
+        self._last_read = time.time()
+        with self._lock:
+            history = self._history(race_no)
+        if history is None:
+            return None
+        race_cache.touch(self._cache_key(race_no), self)
+        return {key: {method: store.snapshot() for method, store in history[key].items()} for key in HISTORY_KEYS}
@@ -0,0 +1,103 @@
+# collector_daemon.py
+import argparse
+import logging
+import multiprocessing
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from metrics import metrics
+from logging_setup import setup_logging
+from config import VENUE_OPTIONS, METHOD_LIST_WITH_QPL, ARCHIVE_PATH, ARCHIVE_BATCH_SIZE
+
+# 獨立於 Streamlit 的收集程序: 每個場地 (包括 S1-S5 海外場地) 一個工作程序,
+# 收集整個賽事日直至所有投注池停止投注, 數據寫入本地存檔供 Streamlit 檢視器讀取
+# 輪詢間隔按開跑時間調整 (見 scheduler.py), --interval 改為固定間隔
+# 用法: python collector_daemon.py --date 2025-01-01 [--venues ST S1] [--archive data/archive.sqlite]
+# 每個工作程序在 metrics_port + 序號 提供 Prometheus 文字格式的 /metrics,
+# 在 feed_port + 序號 以 server-sent events 推送每個 tick 的快照 (見 feed.py)
+# 主程序只負責啟動工作程序, 收集用的模組 (numpy, pandas, HTTP 客戶端) 只在工作程序內載入
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_metrics(port):
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+def run_meeting(date, venue, archive_path, interval, metrics_port=None, feed_port=None):
+    setup_logging()
+    from archive import SnapshotArchive
+    from collector import MeetingCollector
+    from feed import SnapshotFeed, serve_feed
+    from data_fetch import get_race_info_sync, RaceInfoError
+    try:
+        race_dict, post_time_dict = get_race_info_sync(date, venue)
+    except RaceInfoError as e:
+        logging.error(f"Collector for {date} {venue} stopped: {e}")
+        return
+    if not post_time_dict:
+        logging.info(f"No meeting for {date} {venue}")
+        return
+    if metrics_port:
+        serve_metrics(metrics_port)
+    feed = None
+    if feed_port:
+        feed = SnapshotFeed()
+        serve_feed(feed, feed_port)
+    archive = SnapshotArchive(archive_path, batch_size=ARCHIVE_BATCH_SIZE)
+    collector = MeetingCollector(date, venue, METHOD_LIST_WITH_QPL, archive, interval=interval, feed=feed)
+    collector.set_races(sorted(post_time_dict), post_time_dict)
+    logging.info(f"Collecting {date} {venue}: races {sorted(post_time_dict)}")
+    try:
+        while not collector.finished:
+            collector.tick()
+            time.sleep(collector.next_delay())
+        logging.info(f"All pools closed for {date} {venue}")
+    finally:
+        archive.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Collect HKJC odds and investments without Streamlit")
+    parser.add_argument("--date", required=True, help="賽事日期, 例如 2025-01-01")
+    parser.add_argument("--venues", nargs="+", default=VENUE_OPTIONS, choices=VENUE_OPTIONS)
+    parser.add_argument("--archive", default=ARCHIVE_PATH)
+    parser.add_argument("--interval", type=float, help="固定輪詢秒數 (預設按開跑時間調整)")
+    parser.add_argument("--metrics-port", type=int, help="第一個場地的 /metrics 埠號, 其後場地順序加一")
+    parser.add_argument("--feed-port", type=int, help="第一個場地的 /feed (server-sent events) 埠號, 其後場地順序加一")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    # spawn: 工作程序不繼承父程序的事件迴圈及連線
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(
+            target=run_meeting,
+            args=(args.date, venue, args.archive, args.interval, args.metrics_port + i if args.metrics_port else None,
+                  args.feed_port + i if args.feed_port else None),
+            name=f"collector-{venue}",
+        )
+        for i, venue in enumerate(args.venues)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+if __name__ == "__main__":
+    main()
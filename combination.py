@@ -0,0 +1,61 @@
+# combination.py
+from functools import lru_cache
+from math import comb, perm
+from itertools import combinations, permutations
+import numpy as np
+import pandas as pd
+
+# 每個投注類型的組合大小; FCT 有次序, 其餘不分次序
+COMBINATION_SIZE = {"WIN": 1, "PLA": 1, "QIN": 2, "QPL": 2, "FCT": 2, "TRI": 3, "FF": 4}
+ORDERED_METHODS = ["FCT"]
+MAX_FIELD_SIZE = 24
+
+# 每場每個投注類型的組合索引, 按出賽馬匹數目建立一次:
+# 組合 -> 整數 id, runners 為每個組合的馬號 (uint8), 順序與 combString 排序一致
+class CombinationIndex:
+    def __init__(self, method, field_size):
+        self.method = method
+        self.field_size = field_size
+        size = COMBINATION_SIZE[method]
+        horses = range(1, field_size + 1)
+        combos = permutations(horses, size) if method in ORDERED_METHODS else combinations(horses, size)
+        self.runners = np.array(list(combos), dtype=np.uint8).reshape(-1, size)
+        labels = [",".join(f"{horse:02d}" for horse in combo) for combo in self.runners.tolist()]
+        if size == 1:
+            self.columns = pd.Index(np.arange(1, field_size + 1))
+        else:
+            self.columns = pd.Index(labels)
+        # combString 可能有或沒有前導零, 兩種寫法都可直接查到 id
+        self.ids = {label: i for i, label in enumerate(labels)}
+        for i, combo in enumerate(self.runners.tolist()):
+            self.ids.setdefault(",".join(str(horse) for horse in combo), i)
+
+    def __len__(self):
+        return len(self.runners)
+
+@lru_cache(maxsize=None)
+def get_combination_index(method, field_size):
+    return CombinationIndex(method, int(field_size))
+
+def combination_count(method, field_size):
+    count = perm if method in ORDERED_METHODS else comb
+    return count(field_size, COMBINATION_SIZE[method])
+
+@lru_cache(maxsize=None)
+def _field_size_by_length(method):
+    return {combination_count(method, n): n for n in range(COMBINATION_SIZE[method], MAX_FIELD_SIZE + 1)}
+
+def index_for_length(method, length):
+    # 由密集陣列長度反查組合索引 (組合數隨馬匹數嚴格遞增)
+    field_size = _field_size_by_length(method).get(length)
+    if field_size is None:
+        raise ValueError(f"No {method} combination index with {length} entries")
+    return get_combination_index(method, field_size)
+
+def infer_field_size(comb_strings):
+    # 只在沒有 WIN/PLA 時使用的後備做法
+    return max((int(horse) for comb in comb_strings if comb for horse in comb.split(",")), default=0)
+
+def plain_label(label):
+    # 欄位標籤轉為 Python 原生類型 (WIN/PLA 的馬號是 np.int64), 可直接 JSON 序列化
+    return label.item() if hasattr(label, "item") else label
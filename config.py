@@ -1,5 +1,7 @@
 # config.py
-API_URL = "https://info.cld.hkjc.com/graphql/base/"
+import os
+
+API_URL = os.environ.get("HKJC_API_URL", "https://info.cld.hkjc.com/graphql/base/")
 HEADERS = {"Content-Type": "application/json"}
 
 # 場地選項
@@ -21,3 +23,76 @@ BENCHMARK_DICT = {
     "QIN": 50,
     "QPL": 100
 }
+
+# 圖表「改變」為最近多少個 tick 的投注變動總和
+CHANGE_WINDOW = 10
+# 快取的圖表 spec 數目 (所有 session 共用)
+CHART_CACHE_SIZE = 256
+
+# 歷史紀錄保留: 數值以 HISTORY_DTYPE 儲存; 開跑前 HISTORY_FULL_MINUTES 分鐘內保留每個 tick,
+# 更早的每 HISTORY_DOWNSAMPLE 秒只留最後一行 (可壓縮的行數達到 HISTORY_COMPACT_ROWS 才重新分配)
+HISTORY_DTYPE = "float32"
+HISTORY_FULL_MINUTES = 30
+HISTORY_DOWNSAMPLE = 300
+HISTORY_COMPACT_ROWS = 64
+# 每個收集器所有歷史紀錄的記憶體上限 (bytes); 超出時由已完結的場次開始只保留圖表快照
+HISTORY_MEMORY_BUDGET = int(os.environ.get("RACE_HISTORY_BUDGET", 256 * 1024 * 1024))
+
+# 記憶體中保留歷史紀錄的場次數目 (所有場地共用, 按最近觀看); 仍在收集的場次不會被釋放
+RACE_CACHE_SIZE = 12
+
+# 熱門組合: 每個投注類型, 範圍 (上一個 tick / 最近 CHANGE_WINDOW 個 tick) 及排名方式保留的組合數目
+MOVERS_TOP_K = 5
+
+# 異常投注: 每場保留最近的警報數目, 頁面顯示的數目
+ALERT_HISTORY = 500
+ALERT_DISPLAY = 20
+
+# 投注池 sellStatus 為這些值時已停止投注; 其他值 (例如暫停) 繼續輪詢
+POOL_STOPPED_STATUSES = ("STOP_SELL",)
+
+# 共用收集器: 沒有觀看者後停止的秒數
+COLLECT_IDLE_TIMEOUT = 300
+
+# 按開跑時間調整輪詢: (開跑前分鐘數, 間隔秒數), 超出最後一項用 POLL_INTERVAL_FAR
+POLL_SCHEDULE = [(2, 3), (5, 5), (25, 15), (60, 30), (120, 60)]
+POLL_INTERVAL_FAR = 300
+# 連續失敗時的退避秒數 (指數增長, 帶隨機抖動)
+POLL_BACKOFF_BASE = 5
+POLL_BACKOFF_MAX = 300
+# 頁面自動刷新的最短間隔 (毫秒)
+REFRESH_MIN_INTERVAL = 5000
+
+# embedded: Streamlit 內的共用收集器負責抓取; external: 由 collector_daemon.py 抓取, Streamlit 只讀取存檔
+COLLECTOR_MODE = os.environ.get("RACE_COLLECTOR_MODE", "embedded")
+
+# 網絡設定
+FETCH_TIMEOUT = 8  # 每次嘗試的秒數上限
+FETCH_DEADLINE = 20  # 每個請求連同重試的總秒數上限
+FETCH_RETRIES = 2  # 連線錯誤, 逾時, 429 及 5xx 的重試次數
+FETCH_RETRY_BACKOFF = 0.5  # 重試等待秒數 (每次加倍, 帶抖動)
+FETCH_POOL_SIZE = 20  # keep-alive 連線池大小
+FETCH_KEEPALIVE = 75  # 閒置連線保留秒數
+BREAKER_THRESHOLD = 5  # 連續失敗次數達到此值便熔斷
+BREAKER_RESET = 30  # 熔斷後等待多少秒才試探
+STALE_MAX_AGE = 600  # 請求失敗時可使用多舊的成功回應 (秒)
+
+# 本地快照存檔
+ARCHIVE_PATH = os.environ.get("RACE_ARCHIVE_PATH", os.path.join("data", "archive.sqlite"))
+ARCHIVE_BATCH_SIZE = 500
+# 靜態排位表 (馬名, 練馬師, 往績) 每個日期/場地抓取一次後存放的目錄
+RACE_CARD_DIR = os.environ.get("RACE_CARD_DIR", os.path.join("data", "race_cards"))
+
+# 本地推送 (collector_daemon.py --feed-port): 每個訂閱者最多積壓的訊息數目, 沒有訊息時的保持連線秒數
+FEED_QUEUE_SIZE = 256
+FEED_KEEPALIVE = 15
+
+# 日誌檔案 (由 logging_setup.setup_logging 設定)
+LOG_PATH = os.environ.get("RACE_LOG_PATH", "app.log")
+
+# 各處理階段的耗時及大小統計 (RACE_METRICS=0 停用); 每個序列保留最近的樣本數目計算百分位數
+METRICS_ENABLED = os.environ.get("RACE_METRICS", "1") != "0"
+METRICS_SAMPLES = 512
+
+# 重播/回測: 設定 RACE_RECORD_PATH 時記錄所有 API 回應 (JSONL)
+RECORD_PATH = os.environ.get("RACE_RECORD_PATH")
@@ -1,203 +1,180 @@
 # data_fetch.py
-import requests
-import aiohttp
 import asyncio
-import streamlit as st
-import pandas as pd
+import json
+import os
 import numpy as np
 import logging
 from datetime import datetime
-from config import API_URL, HEADERS, METHOD_LIST_WITH_QPL
+from combination import get_combination_index, infer_field_size
+from recording import ResponseRecorder
+from http_client import FetchError, loads_json, post_json, post_json_async, run_async
+from config import API_URL, RECORD_PATH, RACE_CARD_DIR
 
-# Set up logging
-logging.basicConfig(filename='app.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# 設定 RACE_RECORD_PATH 時, 所有 API 回應會記錄下來供 replay.py 重播
+_recorder = ResponseRecorder(RECORD_PATH) if RECORD_PATH else None
 
-@st.cache_data(ttl=60)
-def get_race_info_sync(_date, _place):
-    url = API_URL
-    payload = {
-        "operationName": "raceMeetings",
-        "variables": {"date": str(_date), "venueCode": _place},
-        "query": """
-        fragment raceFragment on Race {
-            id
+def set_recorder(recorder):
+    global _recorder
+    _recorder = recorder
+
+def _record(payload, data):
+    if _recorder is not None:
+        _recorder.write(payload, data)
+
+# 不依賴 Streamlit, 由呼叫者決定快取及如何顯示錯誤 (失敗時拋出 RaceInfoError)
+class RaceInfoError(Exception):
+    pass
+
+# 賽事資訊分為兩個查詢: 靜態的排位表每個日期/場地只抓取一次並存到磁碟,
+# 會變動的開跑時間, 場次及馬匹狀態 (退出) 和騎師以細小的查詢每次刷新
+RACE_CARD_QUERY = """
+query raceMeetings($date: String, $venueCode: String) {
+    raceMeetings(date: $date, venueCode: $venueCode) {
+        id
+        venueCode
+        date
+        races {
             no
-            status
-            raceName_en
-            raceName_ch
             postTime
-            country_en
-            country_ch
-            distance
-            wageringFieldSize
-            go_en
-            go_ch
-            ratingType
-            raceTrack { description_en description_ch }
-            raceCourse { description_en description_ch displayCode }
-            claCode
-            raceClass_en
-            raceClass_ch
-            judgeSigns { value_en }
-        }
-        fragment racingBlockFragment on RaceMeeting {
-            jpEsts: pmPools(oddsTypes: [TCE, TRI, FF, QTT, DT, TT, SixUP], filters: ["jackpot", "estimatedDividend"]) {
-                leg { number races }
-                oddsType
-                jackpot
-                estimatedDividend
-                mergedPoolId
-            }
-            poolInvs: pmPools(oddsTypes: [WIN, PLA, QIN, QPL, CWA, CWB, CWC, IWN, FCT, TCE, TRI, FF, QTT, DBL, TBL, DT, TT, SixUP]) {
-                id
-                leg { races }
-            }
-            penetrometerReadings(filters: ["first"]) { reading readingTime }
-            hammerReadings(filters: ["first"]) { reading readingTime }
-            changeHistories(filters: ["top3"]) {
-                type
-                time
-                raceNo
-                runnerNo
-                horseName_ch
-                horseName_en
-                jockeyName_ch
-                jockeyName_en
-                scratchHorseName_ch
-                scratchHorseName_en
-                handicapWeight
-                scrResvIndicator
-            }
-        }
-        query raceMeetings($date: String, $venueCode: String) {
-            timeOffset { rc }
-            activeMeetings: raceMeetings { id venueCode date status races { no postTime status wageringFieldSize } }
-            raceMeetings(date: $date, venueCode: $venueCode) {
+            runners {
                 id
+                no
+                standbyNo
                 status
-                venueCode
-                date
-                totalNumberOfRace
-                currentNumberOfRace
-                dateOfWeek
-                meetingType
-                totalInvestment
-                country { code namech nameen seq }
-                races { ...raceFragment
-                    runners {
-                        id
-                        no
-                        standbyNo
-                        status
-                        name_ch
-                        name_en
-                        horse { id code }
-                        color
-                        barrierDrawNumber
-                        handicapWeight
-                        currentWeight
-                        currentRating
-                        internationalRating
-                        gearInfo
-                        racingColorFileName
-                        allowance
-                        trainerPreference
-                        last6run
-                        saddleClothNo
-                        trumpCard
-                        priority
-                        finalPosition
-                        deadHeat
-                        winOdds
-                        jockey { code name_en name_ch }
-                        trainer { code name_en name_ch }
-                    }
-                }
-                obSt: pmPools(oddsTypes: [WIN, PLA]) { leg { races } oddsType comingleStatus }
-                poolInvs: pmPools(oddsTypes: [WIN, PLA, QIN, QPL, CWA, CWB, CWC, IWN, FCT, TCE, TRI, FF, QTT, DBL, TBL, DT, TT, SixUP]) {
-                    id
-                    leg { number races }
-                    status
-                    sellStatus
-                    oddsType
-                    investment
-                    mergedPoolId
-                    lastUpdateTime
-                }
-                ...racingBlockFragment
-                pmPools(oddsTypes: []) { id }
-                jkcInstNo: foPools(oddsTypes: [JKC], filters: ["top"]) { instNo }
-                tncInstNo: foPools(oddsTypes: [TNC], filters: ["top"]) { instNo }
+                name_ch
+                last6run
+                jockey { name_ch }
+                trainer { name_ch }
             }
         }
-        """
     }
+}
+"""
+
+RACE_STATUS_QUERY = """
+query raceMeetings($date: String, $venueCode: String) {
+    raceMeetings(date: $date, venueCode: $venueCode) {
+        id
+        status
+        races {
+            no
+            status
+            postTime
+            runners { no status jockey { name_ch } }
+        }
+    }
+}
+"""
+
+def _race_info_payload(_date, _place, query):
+    return {"operationName": "raceMeetings", "variables": {"date": str(_date), "venueCode": _place}, "query": query}
+
+def _post_race_info(payload, _date, _place):
+    try:
+        # 請求失敗時使用最近一次成功的回應
+        data = post_json(API_URL, payload, stale_ok=True)
+    except FetchError as e:
+        logging.error(f"Race info API request failed for {_date} {_place}: {e}")
+        if e.status is not None:
+            raise RaceInfoError(f"賽事資訊 API 請求失敗，狀態碼: {e.status}") from e
+        raise RaceInfoError(f"無法獲取賽事資訊: {e}") from e
+    _record(payload, data)
+    return data
+
+def _race_meetings(data):
+    return ((data or {}).get('data') or {}).get('raceMeetings') or []
+
+def _race_card_path(_date, _place):
+    return os.path.join(RACE_CARD_DIR, f"{_date}_{_place}.json")
+
+def get_race_card(_date, _place):
+    # 靜態排位表: 磁碟上已有便直接使用; 抓取後有排位 (已公佈出賽馬匹) 才存檔
+    path = _race_card_path(_date, _place)
     try:
-        response = requests.post(url, json=payload, headers=HEADERS)
-        if response.status_code == 200:
-            data = response.json()
-            logging.info(f"Race info API request successful: {url}, payload: {payload}")
-            race_dict = {}
-            post_time_dict = {}
-            race_meetings = data.get('data', {}).get('raceMeetings', [])
-            if not race_meetings:
-                logging.warning(f"No race meetings found for date: {_date}, place: {_place}")
-                return {}, {}
-            for meeting in race_meetings:
-                races = meeting.get('races', [])
-                if not races:
-                    logging.warning(f"No races found for date: {_date}, place: {_place}")
+        with open(path, "rb") as f:
+            return loads_json(f.read())
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable race card {path}: {e}")
+    data = _post_race_info(_race_info_payload(_date, _place, RACE_CARD_QUERY), _date, _place)
+    if any(race.get('runners') for meeting in _race_meetings(data) for race in meeting.get('races', [])):
+        try:
+            os.makedirs(RACE_CARD_DIR, exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logging.warning(f"Could not save race card {path}: {e}")
+    logging.info(f"Race card loaded for {_date} {_place}")
+    return data
+
+def get_race_status(_date, _place):
+    # {場次: race} 的開跑時間及狀態; 失敗時返回 None, 由排位表的數據代替
+    try:
+        data = _post_race_info(_race_info_payload(_date, _place, RACE_STATUS_QUERY), _date, _place)
+    except RaceInfoError as e:
+        logging.warning(f"Race status unavailable for {_date} {_place}, using race card: {e}")
+        return None
+    return {race.get("no"): race for meeting in _race_meetings(data) for race in meeting.get('races', [])}
+
+def get_race_info_sync(_date, _place):
+    card = get_race_card(_date, _place)
+    status = get_race_status(_date, _place) or {}
+    try:
+        race_dict = {}
+        post_time_dict = {}
+        race_meetings = _race_meetings(card)
+        if not race_meetings:
+            logging.warning(f"No race meetings found for date: {_date}, place: {_place}")
+            return {}, {}
+        for meeting in race_meetings:
+            races = meeting.get('races', [])
+            if not races:
+                logging.warning(f"No races found for date: {_date}, place: {_place}")
+                continue
+            for race in races:
+                race_number = race.get("no")
+                if not race_number:
                     continue
-                for race in races:
-                    race_number = race.get("no")
-                    if not race_number:
-                        continue
-                    # Validate place against runner ID
-                    runners = race.get('runners', [])
-                    if runners and _place not in ["ST", "HV"]:
-                        runner_id = runners[0].get('id', '')
-                        if runner_id and runner_id[8:10] != _place:
-                            continue
-                    post_time = race.get("postTime")
-                    time_part = datetime.fromisoformat(post_time) if post_time else None
-                    post_time_dict[race_number] = time_part
-                    race_dict[race_number] = {"馬名": [], "騎師": [], "練馬師": [], "最近賽績": []}
-                    if not runners:
-                        logging.warning(f"No runners found for race {race_number}")
+                # Validate place against runner ID
+                runners = race.get('runners', [])
+                if runners and _place not in ["ST", "HV"]:
+                    runner_id = runners[0].get('id', '')
+                    if runner_id and runner_id[8:10] != _place:
                         continue
-                    for runner in runners:
-                        if runner.get('standbyNo') == "":
-                            race_dict[race_number]["馬名"].append(runner.get('name_ch', ''))
-                            race_dict[race_number]["騎師"].append(runner.get('jockey', {}).get('name_ch', ''))
-                            race_dict[race_number]["練馬師"].append(runner.get('trainer', {}).get('name_ch', ''))
-                            race_dict[race_number]["最近賽績"].append(runner.get('last6run', ''))
-            if not race_dict:
-                logging.warning(f"No valid race data constructed for date: {_date}, place: {_place}")
-            return race_dict, post_time_dict
-        else:
-            logging.error(f"Race info API request failed, status code: {response.status_code}")
-            st.error(f"賽事資訊 API 請求失敗，狀態碼: {response.status_code}")
-            return {}, {}
+                live = status.get(race_number, {})
+                post_time = live.get("postTime") or race.get("postTime")
+                time_part = datetime.fromisoformat(post_time) if post_time else None
+                post_time_dict[race_number] = time_part
+                race_dict[race_number] = {"馬名": [], "騎師": [], "練馬師": [], "最近賽績": [], "狀態": []}
+                if not runners:
+                    logging.warning(f"No runners found for race {race_number}")
+                    continue
+                live_runners = {runner['no']: runner for runner in live.get('runners', []) if runner.get('no')}
+                for runner in runners:
+                    if runner.get('standbyNo') == "":
+                        current = live_runners.get(runner.get('no')) or runner
+                        race_dict[race_number]["馬名"].append(runner.get('name_ch', ''))
+                        race_dict[race_number]["騎師"].append((current.get('jockey') or runner.get('jockey') or {}).get('name_ch', ''))
+                        race_dict[race_number]["練馬師"].append(runner.get('trainer', {}).get('name_ch', ''))
+                        race_dict[race_number]["最近賽績"].append(runner.get('last6run', ''))
+                        race_dict[race_number]["狀態"].append("退出" if "scratch" in (current.get('status') or "").lower() else "")
+        if not race_dict:
+            logging.warning(f"No valid race data constructed for date: {_date}, place: {_place}")
+        return race_dict, post_time_dict
     except Exception as e:
         logging.error(f"Error in get_race_info_sync: {e}")
-        st.error(f"無法獲取賽事資訊: {e}")
-        return {}, {}
+        raise RaceInfoError(f"無法獲取賽事資訊: {e}") from e
 
-# data_fetch.py
-import requests
-import numpy as np
-import pandas as pd
-import streamlit as st
-import logging
-from datetime import datetime
+# 賠率及投注額查詢
+ODDS_TYPES = ["WIN", "PLA", "QIN", "QPL", "FCT", "TRI", "FF"]
 
-logging.basicConfig(filename='app.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+def _empty_pools():
+    return {method: [] for method in ODDS_TYPES}
 
-def get_investment_data(Date, place, race_no, methodlist):
-    url = 'https://info.cld.hkjc.com/graphql/base/'
-    headers = {'Content-Type': 'application/json'}
-    
-    payload_investment = {
+def _investment_payload(Date, place, race_no, methodlist):
+    return {
           "operationName": "racing",
           "variables": {
               "date": str(Date),
@@ -226,48 +203,11 @@ def get_investment_data(Date, place, race_no, methodlist):
           }
           """
       }
-    
-    response = requests.post(url, headers=headers, json=payload_investment)
-    
-    if response.status_code == 200:
-        investment_data = response.json()
-    
-          # Extracting the investment into different types of oddsType
-        investments = {
-              "WIN": [],
-              "PLA": [],
-              "QIN": [],
-              "QPL": [],
-              "FCT": [],
-              "TRI": [],
-              "FF": []
-          }
-    
-        race_meetings = investment_data.get('data', {}).get('raceMeetings', [])
-        if race_meetings:
-              for meeting in race_meetings:
-                  pool_invs = meeting.get('poolInvs', [])
-                  for pool in pool_invs:
-                      if place not in ['ST','HV']:
-                        id = pool.get('id')
-                        if id[8:10] != place:
-                          continue                
-                      investment = float(pool.get('investment'))
-                      investments[pool.get('oddsType')].append(investment)
-    
-              #print("Investments:", investments)
-        else:
-              print("No race meetings found in the response.")
-    
-        return investments
-    else:
-        logging.error(f"Error fetching investment data for race {race_no}: {response.status_code}")
-        return {method: [] for method in ["WIN", "PLA", "QIN", "QPL", "FCT", "TRI", "FF"]}
 
-def get_odds_data(Date, place, race_no, methodlist):
-      url = 'https://info.cld.hkjc.com/graphql/base/'
-      headers = {'Content-Type': 'application/json'}
-      payload_odds = {
+# 賠率查詢只取 combString/oddsValue 及投注池狀態; bankerOdds, cWinSelections, hotFavourite,
+# oddsDropValue 及名稱等欄位沒有用到, TRI/FF 有數千個節點時會令回應大幅膨脹
+def _odds_payload(Date, place, race_no, methodlist):
+    return {
           "operationName": "racing",
           "variables": {
               "date": str(Date),
@@ -284,89 +224,213 @@ def get_odds_data(Date, place, race_no, methodlist):
                 sellStatus
                 oddsType
                 lastUpdateTime
-                guarantee
-                minTicketCost
-                name_en
-                name_ch
-                leg {
-                  number
-                  races
-                }
-                cWinSelections {
-                  composite
-                  name_ch
-                  name_en
-                  starters
-                }
                 oddsNodes {
                   combString
                   oddsValue
-                  hotFavourite
-                  oddsDropValue
-                  bankerOdds {
-                    combString
-                    oddsValue
-                  }
                 }
               }
             }
           }
           """
       }
-    
-      response = requests.post(url, headers=headers, json=payload_odds)
-      if response.status_code == 200:
-          odds_data = response.json()
-              # Extracting the oddsValue into different types of oddsType and sorting by combString for QIN and QPL
-          # Initialize odds_values with empty lists for each odds type
-          odds_values = {
-              "WIN": [],
-              "PLA": [],
-              "QIN": [],
-              "QPL": [],
-              "FCT": [],
-              "TRI": [],
-              "FF": []
-          }
-          
-          race_meetings = odds_data.get('data', {}).get('raceMeetings', [])
+
+def _parse_investment_data(investment_data, place):
+    # Extracting the investment into different types of oddsType
+    investments = _empty_pools()
+    race_meetings = (investment_data.get('data') or {}).get('raceMeetings') or []
+    if race_meetings:
           for meeting in race_meetings:
-              pm_pools = meeting.get('pmPools', [])
-              for pool in pm_pools:
-                  if place not in ['ST', 'HV']:
-                      id = pool.get('id')
-                      if id and id[8:10] != place:  # Check if id exists before slicing
-                          continue
-                  odds_nodes = pool.get('oddsNodes', [])
-                  odds_type = pool.get('oddsType')
-                  odds_values[odds_type] = []
-                  # Skip if odds_type is invalid or not in odds_values
-                  if not odds_type or odds_type not in odds_values:
+              pool_invs = meeting.get('poolInvs', [])
+              for pool in pool_invs:
+                  if place not in ['ST','HV']:
+                    id = pool.get('id')
+                    if id[8:10] != place:
+                      continue
+                  investment = float(pool.get('investment'))
+                  investments[pool.get('oddsType')].append(investment)
+    else:
+          print("No race meetings found in the response.")
+    return investments
+
+def _parse_odds_data(odds_data, place, field_size=None):
+      # 每個投注類型的賠率寫入按組合索引排列的密集陣列, SCR 為 inf, 缺少或無效的組合為 nan
+      # 只抓取部分投注類型 (沒有 WIN/PLA) 時, 由 field_size 提供出賽馬匹數目
+      odds_values = _empty_pools()
+      pools = []
+      # GraphQL 錯誤回應的 data 為 null, 當作沒有投注池
+      race_meetings = (odds_data.get('data') or {}).get('raceMeetings') or []
+      for meeting in race_meetings:
+          pm_pools = meeting.get('pmPools', [])
+          for pool in pm_pools:
+              if place not in ['ST', 'HV']:
+                  id = pool.get('id')
+                  if id and id[8:10] != place:  # Check if id exists before slicing
                       continue
-                  for node in odds_nodes:
-                      oddsValue = node.get('oddsValue')
-                      # Skip iteration if oddsValue is None, empty, or '---'
-                      if oddsValue == 'SCR':
-                          oddsValue = np.inf
-                      else:
-                          try:
-                              oddsValue = float(oddsValue)
-                          except (ValueError, TypeError):
-                              continue  # Skip if oddsValue can't be converted to float
-                      # Store data based on odds_type
-                      if odds_type in ["QIN", "QPL", "FCT", "TRI", "FF"]:
-                          comb_string = node.get('combString')
-                          if comb_string:  # Ensure combString exists
-                              odds_values[odds_type].append((comb_string, oddsValue))
-                      else:
-                          odds_values[odds_type].append(oddsValue)
-          # Sorting the odds values for specific types by combString in ascending order
-          for odds_type in ["QIN", "QPL", "FCT", "TRI", "FF"]:
-              odds_values[odds_type].sort(key=lambda x: x[0], reverse=False)
-          return odds_values
-      else:
-        logging.error(f"Error fetching odds data for race {race_no}: {response.status_code}")
-        return {method: [] for method in ["WIN", "PLA", "QIN", "QPL", "FCT", "TRI", "FF"]}
+              odds_type = pool.get('oddsType')
+              # Skip if odds_type is invalid or not in odds_values
+              if not odds_type or odds_type not in odds_values:
+                  continue
+              pools.append((odds_type, pool.get('oddsNodes') or []))
+      # 出賽馬匹數目取自 WIN/PLA, 組合索引按此建立一次並重用
+      field_size = max((int(node['combString']) for odds_type, nodes in pools if odds_type in ["WIN", "PLA"]
+                        for node in nodes if node.get('combString')), default=0) or field_size
+      for odds_type, odds_nodes in pools:
+          if not odds_nodes:
+              continue
+          size = field_size or infer_field_size(node.get('combString') for node in odds_nodes)
+          if not size:
+              continue
+          odds_values[odds_type] = _odds_array(get_combination_index(odds_type, size), odds_nodes)
+      return odds_values
+
+def _odds_array(index, odds_nodes):
+      # combString 經組合索引直接定位, oddsValue 一次轉換為 float64 (SCR 為 inf)
+      values = np.full(len(index), np.nan)
+      ids = index.ids
+      positions = np.fromiter((ids.get(node.get('combString'), -1) for node in odds_nodes), dtype=np.intp, count=len(odds_nodes))
+      raw = ['inf' if node.get('oddsValue') == 'SCR' else node.get('oddsValue') for node in odds_nodes]
+      try:
+          parsed = np.array(raw, dtype=np.float64)
+      except (ValueError, TypeError):
+          # 有無效的賠率 (例如 '---'), 逐個轉換並略過
+          parsed = np.full(len(raw), np.nan)
+          for i, oddsValue in enumerate(raw):
+              try:
+                  parsed[i] = float(oddsValue)
+              except (ValueError, TypeError):
+                  continue
+      valid = positions >= 0
+      values[positions[valid]] = parsed[valid]
+      return values
+
+def get_investment_data(Date, place, race_no, methodlist):
+    payload = _investment_payload(Date, place, race_no, methodlist)
+    try:
+        data = post_json(API_URL, payload, stale_ok=True)
+    except FetchError as e:
+        logging.error(f"Error fetching investment data for race {race_no}: {e}")
+        return _empty_pools()
+    _record(payload, data)
+    return _parse_investment_data(data, place)
+
+def get_odds_data(Date, place, race_no, methodlist):
+      payload = _odds_payload(Date, place, race_no, methodlist)
+      try:
+          data = post_json(API_URL, payload, stale_ok=True)
+      except FetchError as e:
+          logging.error(f"Error fetching odds data for race {race_no}: {e}")
+          return _empty_pools()
+      _record(payload, data)
+      return _parse_odds_data(data, place)
+
+# 非同步抓取經 http_client 的常駐事件迴圈及共用連線池, 賠率及投注額兩個查詢同時發出
+# 非 200 回應返回 (status, None); 網絡錯誤及熔斷拋出 FetchError
+async def _post_json(payload):
+    try:
+        data = await post_json_async(API_URL, payload)
+    except FetchError as e:
+        if e.status is None:
+            raise
+        return e.status, None
+    _record(payload, data)
+    return 200, data
+
+async def get_odds_and_investment_data_async(Date, place, race_no, methodlist):
+    odds_result, investment_result = await asyncio.gather(
+        _post_json(_odds_payload(Date, place, race_no, methodlist)),
+        _post_json(_investment_payload(Date, place, race_no, methodlist)),
+        return_exceptions=True,
+    )
+    odds_values = _empty_pools()
+    investments = _empty_pools()
+    if isinstance(odds_result, Exception):
+        logging.error(f"Error fetching odds data for race {race_no}: {odds_result}")
+    elif odds_result[1] is None:
+        logging.error(f"Error fetching odds data for race {race_no}: {odds_result[0]}")
+    else:
+        odds_values = _parse_odds_data(odds_result[1], place)
+    if isinstance(investment_result, Exception):
+        logging.error(f"Error fetching investment data for race {race_no}: {investment_result}")
+    elif investment_result[1] is None:
+        logging.error(f"Error fetching investment data for race {race_no}: {investment_result[0]}")
+    else:
+        investments = _parse_investment_data(investment_result[1], place)
+    return odds_values, investments
+
+def get_odds_and_investment_data(Date, place, race_no, methodlist):
+    # 一次 round trip 取得 (odds_values, investments), 格式與 get_odds_data / get_investment_data 相同
+    return run_async(get_odds_and_investment_data_async(Date, place, race_no, methodlist))
+
+# 全場賽事: 投注額一次批量查詢 (不指定 raceNo), 賠率按場次並行查詢
+def _meeting_investment_payload(Date, place, methodlist):
+    payload = _investment_payload(Date, place, 1, methodlist)
+    payload["variables"].pop("raceNo")
+    payload["query"] = payload["query"].replace(", $raceNo: Int", "").replace(", raceNo: $raceNo", "")
+    return payload
+
+def _parse_meeting_investment_data(investment_data, place, race_nos):
+    # 返回每場的投注額及每個投注池的狀態 (lastUpdateTime, status, sellStatus)
+    investments_by_race = {race_no: _empty_pools() for race_no in race_nos}
+    states_by_race = {race_no: {} for race_no in race_nos}
+    for meeting in (investment_data.get('data') or {}).get('raceMeetings') or []:
+        for pool in meeting.get('poolInvs', []) or []:
+            if place not in ['ST', 'HV']:
+                id = pool.get('id')
+                if id and id[8:10] != place:
+                    continue
+            races = (pool.get('leg') or {}).get('races') or []
+            odds_type = pool.get('oddsType')
+            if not races or odds_type not in ODDS_TYPES:
+                continue
+            race_no = int(races[0])
+            if race_no in investments_by_race:
+                investments_by_race[race_no][odds_type].append(float(pool.get('investment')))
+                states_by_race[race_no][odds_type] = (pool.get('lastUpdateTime'), pool.get('status'), pool.get('sellStatus'))
+    return investments_by_race, states_by_race
+
+async def get_meeting_investments_async(Date, place, race_nos, methodlist):
+    race_nos = [int(race_no) for race_no in race_nos]
+    try:
+        status, data = await _post_json(_meeting_investment_payload(Date, place, methodlist))
+    except Exception as e:
+        status, data = e, None
+    if data is not None:
+        try:
+            return _parse_meeting_investment_data(data, place, race_nos)
+        except Exception as e:
+            status = e
+    logging.error(f"Error fetching meeting investment data for {Date} {place}: {status}")
+    return {race_no: _empty_pools() for race_no in race_nos}, {race_no: {} for race_no in race_nos}
+
+async def get_meeting_odds_async(Date, place, odds_requests, field_sizes=None):
+    # odds_requests: {race_no: 需要重新抓取賠率的投注類型}; field_sizes: {race_no: 已知的出賽馬匹數目}
+    race_nos = list(odds_requests)
+    results = await asyncio.gather(
+        *[_post_json(_odds_payload(Date, place, race_no, odds_requests[race_no])) for race_no in race_nos],
+        return_exceptions=True,
+    )
+    odds_by_race = {}
+    for race_no, odds_result in zip(race_nos, results):
+        if isinstance(odds_result, Exception) or odds_result[1] is None:
+            error = odds_result if isinstance(odds_result, Exception) else odds_result[0]
+            logging.error(f"Error fetching odds data for race {race_no}: {error}")
+            continue
+        # 單場的錯誤回應 (例如 GraphQL errors, data 為 null) 或解析失敗只略過該場, 與抓取失敗相同
+        if odds_result[1].get('data') is None:
+            logging.error(f"Error fetching odds data for race {race_no}: {odds_result[1].get('errors')}")
+            continue
+        try:
+            odds_by_race[race_no] = _parse_odds_data(odds_result[1], place, (field_sizes or {}).get(race_no))
+        except Exception as e:
+            logging.error(f"Error parsing odds data for race {race_no}: {e}")
+    return odds_by_race
 
-# Existing get_race_info_sync remains unchanged
+def get_meeting_investments(Date, place, race_nos, methodlist):
+    # ({race_no: investments}, {race_no: {method: (lastUpdateTime, status, sellStatus)}})
+    return run_async(get_meeting_investments_async(Date, place, race_nos, methodlist))
 
+def get_meeting_odds(Date, place, odds_requests, field_sizes=None):
+    # {race_no: odds_values}, 抓取失敗的場次不會出現
+    if not odds_requests:
+        return {}
+    return run_async(get_meeting_odds_async(Date, place, odds_requests, field_sizes))
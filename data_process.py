@@ -1,74 +1,38 @@
 # data_process.py
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-from dateutil import relativedelta as datere
+from aggregation import aggregate_per_horse
+from combination import get_combination_index, index_for_length
 
 def save_odds_data(time_now, odds, odds_dict):
     for method in odds:
-        if method in ["WIN", "PLA"]:
-            new_row = pd.DataFrame([odds[method]], index=[time_now], columns=np.arange(1, len(odds[method]) + 1))
-        else:
-            if odds[method]:
-                combination, odds_array = zip(*odds[method])
-                new_row = pd.DataFrame([odds_array], index=[time_now], columns=combination)
-            else:
-                continue
-        odds_dict[method] = pd.concat([odds_dict[method], new_row])
+        if not len(odds[method]):
+            continue
+        index = index_for_length(method, len(odds[method]))
+        odds_dict[method].append(time_now, odds[method], index.columns)
 
 def save_investment_data(time_now, investments, odds, investment_dict):
     for method in investments:
-        if method in ["WIN", "PLA"]:
-            investment_df = [round(investments[method][0] * 0.825 / 1000 / odd, 2) for odd in odds[method]]
-            new_row = pd.DataFrame([investment_df], index=[time_now], columns=np.arange(1, len(odds[method]) + 1))
-        else:
-            if odds[method]:
-                combination, odds_array = zip(*odds[method])
-                investment_df = [round(investments[method][0] * 0.825 / 1000 / odd, 2) for odd in odds_array]
-                new_row = pd.DataFrame([investment_df], index=[time_now], columns=combination)
-            else:
-                continue
-        investment_dict[method] = pd.concat([investment_dict[method], new_row])
+        if not len(odds.get(method, [])) or not investments[method]:
+            continue
+        index = index_for_length(method, len(odds[method]))
+        investment_df = np.round(investments[method][0] * 0.825 / 1000 / np.asarray(odds[method]), 2)
+        investment_dict[method].append(time_now, investment_df, index.columns)
 
 def get_overall_investment(time_now, investment_dict, overall_investment_dict, methodlist):
+    # 所有投注類型 (包括 FCT/TRI/FF) 的最新投注額一次分攤到每匹馬
     no_of_horse = len(investment_dict["WIN"].columns)
-    total_investment_df = pd.DataFrame(index=[time_now], columns=np.arange(1, no_of_horse + 1))
-    for method in methodlist:
-        if method in ["WIN", "PLA"]:
-            overall_investment_dict[method] = pd.concat([overall_investment_dict[method], investment_dict[method].tail(1)])
-        elif method in ["QIN", "QPL"]:
-            combined = investment_combined(time_now, method, investment_dict[method].tail(1))
-            overall_investment_dict[method] = pd.concat([overall_investment_dict[method], combined])
-    for horse in range(1, no_of_horse + 1):
-        total_investment = sum(
-            overall_investment_dict[method][horse].iloc[-1] for method in methodlist if horse in overall_investment_dict[method].columns
-        )
-        total_investment_df[horse] = total_investment
-    overall_investment_dict["overall"] = pd.concat([overall_investment_dict["overall"], total_investment_df])
+    horses = np.arange(1, no_of_horse + 1)
+    # 按當前組合索引的次序讀取, 馬匹數目改變後合併的欄位次序不同
+    latest = {method: investment_dict[method].last_for(get_combination_index(method, no_of_horse).columns)
+              for method in methodlist if not investment_dict[method].empty}
+    methods, per_horse = aggregate_per_horse(latest, no_of_horse)
+    for method, row in zip(methods, per_horse):
+        overall_investment_dict[method].append(time_now, row, horses)
+    overall_investment_dict["overall"].append(time_now, per_horse.sum(axis=0), horses)
 
 def investment_combined(time_now, method, df):
-    sums = {}
-    for col in df.columns:
-        num1, num2 = map(int, col.split(","))
-        col_sum = df[col].sum()
-        sums[num1] = sums.get(num1, 0) + col_sum
-        sums[num2] = sums.get(num2, 0) + col_sum
-    return pd.DataFrame([sums], index=[time_now]) / 2
-
-def get_weird_data(investment_dict,odds_dict,methodlist):
-  for method in methodlist:
-    latest_investment = investment_dict[method].tail(1).values
-    last_time_odds = odds_dict[method].tail(2).head(1)
-    expected_investment = investments[method][0]*0.825 / 1000 / last_time_odds
-    diff = round(latest_investment - expected_investment,0)
-    if method in ['WIN','PLA']:
-        diff_dict[method] = diff_dict[method]._append(diff)
-    elif method in ['QIN','QPL']:
-        diff_dict[method] = diff_dict[method]._append(investment_combined(time_now,method,diff))
-    benchmark = benchmark_dict.get(method)
-    diff.index = diff.index.strftime('%H:%M:%S')
-    for index in investment_dict[method].tail(1).columns:
-      error = diff[index].values[0]
-      error_df = []
-      weird_dict[method] = weird_dict[method]._append(error_df)
-
+    # 按組合索引把每個組合的投注額分攤給組合內的馬匹
+    index = index_for_length(method, len(df.columns))
+    _, per_horse = aggregate_per_horse({method: df.to_numpy().sum(axis=0)}, index.field_size)
+    return pd.DataFrame(per_horse, index=[time_now], columns=np.arange(1, index.field_size + 1))
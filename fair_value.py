@@ -0,0 +1,149 @@
+# fair_value.py
+from functools import lru_cache
+from itertools import permutations
+from math import comb
+import numpy as np
+import pandas as pd
+from combination import combination_count, get_combination_index
+
+# 以獨贏賠率推算每個投注類型的公平賠率 (Harville 模型)
+# 獨贏的隱含概率 1/賠率 正規化 (去除抽佣) 後作為每匹馬的勝出概率 p,
+# 有次序的 (a, b, c) 概率 = p_a * p_b / (1 - p_a) * p_c / (1 - p_a - p_b); 無次序的組合把所有排列相加
+# 排列及其對應組合的索引按馬匹數目預先建立一次, 每個 tick 每個組合大小只需一次 gather/prod,
+# 再以 np.bincount 分組到組合 (位置/位置Q 為包含該馬/兩匹馬的前三名排列之和)
+# 退出馬匹的賠率為 inf, 勝出概率為 0, 包含它的組合公平賠率為 inf;
+# 派彩名次數目按實際出賽 (獨贏賠率有效) 的馬匹數目決定, 陣列仍按排位表的馬匹數目排列
+FAIR_METHODS = ["WIN", "PLA", "QIN", "QPL", "FCT", "TRI", "FF"]
+# 每個投注類型需要的有次序排列大小
+PERMUTATION_SIZE = {"WIN": 1, "PLA": 3, "QIN": 2, "QPL": 3, "FCT": 2, "TRI": 3, "FF": 4}
+# 每個大小的無次序組合索引
+UNORDERED_METHOD = {2: "QIN", 3: "TRI", 4: "FF"}
+
+def place_count(field_size):
+    # 7 匹或以上派前三名, 否則派前兩名
+    return 3 if field_size >= 7 else 2
+
+def winning_combinations(method, field_size):
+    # 每場派彩的組合數目, 用來把隱含概率總和換算為 overround
+    if method == "PLA":
+        return place_count(field_size)
+    if method == "QPL":
+        return comb(place_count(field_size), 2)
+    return 1
+
+def _combination_ids(runners, field_size):
+    # 把每個排列按馬號排序後編碼, 在 (已排序的) 組合索引中查出位置
+    size = runners.shape[1]
+    combos = get_combination_index(UNORDERED_METHOD[size], field_size).runners
+    base = field_size + 1
+    weights = base ** np.arange(size - 1, -1, -1)
+    return np.searchsorted(combos.astype(np.int64) @ weights, np.sort(runners, axis=1).astype(np.int64) @ weights)
+
+class FairValuePlan:
+    def __init__(self, field_size, starters=None):
+        self.field_size = field_size
+        self.places = place_count(field_size if starters is None else starters)
+        # 每個大小的全部有次序排列 (馬號), 順序與 FCT 組合索引一致
+        self.permutations = {
+            size: np.array(list(permutations(range(1, field_size + 1), size)), dtype=np.intp).reshape(-1, size)
+            for size in (2, 3, 4) if field_size >= size
+        }
+        # 按位置分開的連續陣列, gather 及逐位置相乘較快
+        self._positions = {size: np.ascontiguousarray(runners.T) for size, runners in self.permutations.items()}
+        self._ids = {}
+
+    def combination_ids(self, size):
+        if size not in self._ids:
+            self._ids[size] = _combination_ids(self.permutations[size], self.field_size)
+        return self._ids[size]
+
+    def pair_ids(self, size):
+        # 每個有次序排列包含的每一對馬在 QIN 組合索引中的位置, 按配對串接
+        key = ("pairs", size)
+        if key not in self._ids:
+            runners = self.permutations[size]
+            pairs = [np.sort(runners[:, pair], axis=1) for pair in ((0, 1), (0, 2), (1, 2))[:comb(size, 2)]]
+            self._ids[key] = np.concatenate([_pair_ids(pair, self.field_size) for pair in pairs])
+        return self._ids[key]
+
+    def ordered(self, p, size):
+        # 每個有次序排列的 Harville 概率
+        chosen = np.concatenate([[0.0], p])[self._positions[size]]
+        probs = chosen[0].copy()
+        used = chosen[0].copy()
+        for position in chosen[1:]:
+            probs *= position / np.clip(1.0 - used, 1e-9, None)
+            used += position
+        return probs
+
+    def probabilities(self, p, methods):
+        # 返回 {投注類型: 按組合索引排列的概率}
+        n = self.field_size
+        places = self.places
+        sizes = {places if method in ("PLA", "QPL") else PERMUTATION_SIZE[method] for method in methods}
+        ordered = {size: self.ordered(p, size) for size in sizes if size in self.permutations}
+        result = {}
+        for method in methods:
+            if method == "WIN":
+                result[method] = p
+            elif method == "FCT" and 2 in ordered:
+                result[method] = ordered[2]
+            elif method in ("QIN", "TRI", "FF") and PERMUTATION_SIZE[method] in ordered:
+                size = PERMUTATION_SIZE[method]
+                result[method] = np.bincount(self.combination_ids(size), weights=ordered[size],
+                                             minlength=combination_count(method, n))
+            elif method == "PLA" and places in ordered:
+                runners = self.permutations[places]
+                result[method] = np.bincount(runners.ravel() - 1, weights=np.repeat(ordered[places], places), minlength=n)
+            elif method == "QPL" and places in ordered:
+                result[method] = np.bincount(self.pair_ids(places), weights=np.tile(ordered[places], comb(places, 2)),
+                                             minlength=combination_count("QPL", n))
+        return result
+
+def _pair_ids(pairs, field_size):
+    # 已排序的 (a, b) 在 QIN 組合索引中的位置
+    a, b = pairs[:, 0] - 1, pairs[:, 1] - 1
+    return a * field_size - a * (a + 1) // 2 + (b - a - 1)
+
+@lru_cache(maxsize=32)
+def get_fair_value_plan(field_size, starters):
+    return FairValuePlan(field_size, starters)
+
+def fair_methods(methodlist):
+    return [method for method in methodlist if method in FAIR_METHODS]
+
+def implied_probabilities(odds):
+    # 1/賠率; 退出 (inf) 及缺少 (nan) 的賠率為 0
+    odds = np.asarray(odds, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        implied = 1.0 / odds
+    return np.where(np.isfinite(implied) & (implied > 0), implied, 0.0)
+
+def fair_values(odds, methods):
+    # odds: {投注類型: 按組合索引排列的市場賠率}; 返回 ({投注類型: 公平賠率}, {投注類型: overround})
+    win = odds.get("WIN")
+    field_size = len(win) if win is not None else 0
+    methods = [method for method in methods
+               if method in FAIR_METHODS and len(odds.get(method, [])) == combination_count(method, field_size)]
+    if not field_size or "WIN" not in methods:
+        return {}, {}
+    p = implied_probabilities(win)
+    # 出賽馬匹: 獨贏賠率有效 (未退出) 的馬匹
+    starters = int(np.count_nonzero(p))
+    overround = {method: float(implied_probabilities(odds[method]).sum()) / winning_combinations(method, starters)
+                 for method in methods}
+    if not starters:
+        return {}, overround
+    p = p / p.sum()
+    plan = get_fair_value_plan(field_size, starters)
+    with np.errstate(divide="ignore"):
+        fair = {method: 1.0 / probs for method, probs in plan.probabilities(p, methods).items()}
+    return fair, overround
+
+def save_fair_values(time_now, odds, fair_dict):
+    # 與 save_odds_data 相同時間寫入 fair_dict: 每個投注類型的公平賠率, 及 "overround" (欄位為投注類型)
+    fair, overround = fair_values(odds, [method for method in fair_dict if method != "overround"])
+    for method, values in fair.items():
+        fair_dict[method].append(time_now, values, get_combination_index(method, len(odds["WIN"])).columns)
+    if overround and "overround" in fair_dict:
+        fair_dict["overround"].append(time_now, list(overround.values()), pd.Index(list(overround)))
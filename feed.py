@@ -0,0 +1,156 @@
+# feed.py
+import json
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from combination import plain_label
+from config import FEED_QUEUE_SIZE, FEED_KEEPALIVE
+
+# 本地推送: 收集器每個 tick 把新增的快照 (賠率, 投注額, 每匹馬的綜合投注額) 推送給訂閱者,
+# 其他工具不需再各自抓取 HKJC API; 以 server-sent events 提供 (GET /feed, 可加 ?race=3 只訂閱一場)
+# 訊息按場次及 tick 合併: 新訂閱者先收到一個 full (每個投注類型的欄位及完整一行),
+# 之後只收到 delta (與上一次推送相比有變動的欄位位置及數值); 欄位改變的投注類型在 delta 中附上 columns 及完整一行
+# 跟不上的訂閱者 (佇列已滿) 會被斷開, 重新連線時再由 full 開始
+FEED_KINDS = {"odds": "odds_dict", "investment": "investment_dict", "overall": "overall_investment_dict"}
+
+def _values(row):
+    # JSON 沒有 inf/nan, 以 null 代替; 保留兩位小數減少訊息大小
+    row = np.round(np.asarray(row, dtype=np.float64), 2)
+    return [value if np.isfinite(value) else None for value in row.tolist()]
+
+class SnapshotFeed:
+    def __init__(self, max_queue=FEED_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self.seq = 0
+        self.meeting = {}
+        self._subscribers = {}
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, race=None):
+        # 返回 (佇列, full 訊息列表); 兩者在同一把鎖內取得, 之後的 delta 剛好接上
+        subscriber = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers[subscriber] = race
+            full = [self._full(race_no, stores) for race_no, stores in self._races().items()
+                    if race is None or race_no == race]
+        return subscriber, full
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.pop(subscriber, None)
+
+    def _races(self):
+        races = {}
+        for (race_no, kind, pool), entry in self._last.items():
+            races.setdefault(race_no, {})[(kind, pool)] = entry
+        return races
+
+    def _full(self, race_no, stores):
+        time_now = max(entry[3] for entry in stores.values())
+        pools = [{"kind": kind, "pool": pool, "columns": columns, "values": _values(row)}
+                 for (kind, pool), (_, columns, row, _) in stores.items()]
+        return {"type": "full", "seq": self.seq, **self.meeting, "race": race_no, "time": time_now, "pools": pools}
+
+    def publish_race(self, date, venue, race_no, history, time_now):
+        # 只推送在 time_now 新增的行; 沒有變動的投注類型不會出現在 delta
+        stamp = np.datetime64(time_now, "ns")
+        text_time = str(stamp.astype("datetime64[s]"))
+        with self._lock:
+            self.meeting = {"date": str(date), "venue": venue}
+            pools = []
+            for kind, key in FEED_KINDS.items():
+                for pool, store in history[key].items():
+                    if store.empty or store.last_time() != stamp:
+                        continue
+                    row = np.array(store.last(), dtype=np.float64)
+                    last = self._last.get((race_no, kind, pool))
+                    # 欄位物件不變 (身份比較) 時沿用已轉換的標籤
+                    if last is not None and last[0] is store.columns:
+                        self._last[(race_no, kind, pool)] = (store.columns, last[1], row, text_time)
+                    else:
+                        columns = [plain_label(label) for label in store.columns]
+                        self._last[(race_no, kind, pool)] = (store.columns, columns, row, text_time)
+                        if last is None or last[1] != columns:
+                            pools.append({"kind": kind, "pool": pool, "columns": columns, "values": _values(row)})
+                            continue
+                    changed = np.flatnonzero(~((row == last[2]) | (np.isnan(row) & np.isnan(last[2]))))
+                    if len(changed):
+                        pools.append({"kind": kind, "pool": pool, "index": changed.tolist(), "values": _values(row[changed])})
+            if not pools:
+                return
+            self.seq += 1
+            message = {"type": "delta", "seq": self.seq, **self.meeting, "race": race_no, "time": text_time, "pools": pools}
+            dropped = []
+            for subscriber, race in self._subscribers.items():
+                if race is not None and race != race_no:
+                    continue
+                try:
+                    subscriber.put_nowait(message)
+                except queue.Full:
+                    dropped.append(subscriber)
+            for subscriber in dropped:
+                # None 通知處理該訂閱者的執行緒斷開連線
+                self._subscribers.pop(subscriber, None)
+                while not subscriber.empty():
+                    subscriber.get_nowait()
+                subscriber.put_nowait(None)
+        if dropped:
+            logging.warning(f"Dropped {len(dropped)} slow feed subscribers")
+
+def _event(message):
+    data = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {message['seq']}\nevent: {message['type']}\ndata: {data}\n\n".encode("utf-8")
+
+class FeedHandler(BaseHTTPRequestHandler):
+    feed = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/feed":
+            self.send_error(404)
+            return
+        race = parse_qs(url.query).get("race")
+        try:
+            race = int(race[0]) if race else None
+        except ValueError:
+            self.send_error(400, "race must be a number")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        subscriber, full = self.feed.subscribe(race)
+        try:
+            for message in full:
+                self.wfile.write(_event(message))
+            self.wfile.flush()
+            while True:
+                try:
+                    message = subscriber.get(timeout=FEED_KEEPALIVE)
+                except queue.Empty:
+                    # 註解行保持連線, 亦可偵測已斷開的訂閱者
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                if message is None:
+                    break
+                self.wfile.write(_event(message))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.feed.unsubscribe(subscriber)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_feed(feed, port):
+    handler = type("BoundFeedHandler", (FeedHandler,), {"feed": feed})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="feed-server", daemon=True).start()
+    return server
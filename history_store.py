@@ -0,0 +1,262 @@
+# history_store.py
+import numpy as np
+import pandas as pd
+from config import HISTORY_DTYPE
+
+# 每個 (場次, 投注類型) 一個歷史紀錄
+# 以預先分配的 NumPy 陣列按行追加, 容量不足時倍增, 追加攤銷成本為 O(1),
+# 取代每個 tick 用 pd.concat 複製整段歷史的做法
+# cumulative=True 時另存逐行累計和, 最近 n 行的總和 (圖表的「改變」) 只需兩行相減;
+# set_marks 登記的時間點 (開跑前 25/5 分鐘) 在追加時增量記下最後一行早於該時間點的位置
+# 數值預設以 float32 儲存, 累計和保持 float64; compact 把舊的行降採樣 (見 retention.py)
+class HistoryStore:
+    def __init__(self, columns=None, capacity=64, dtype=HISTORY_DTYPE, cumulative=False):
+        self.dtype = np.dtype(dtype)
+        self.cumulative = cumulative
+        self._capacity = max(int(capacity), 1)
+        self._size = 0
+        self._index = np.empty(self._capacity, dtype="datetime64[ns]")
+        self.columns = None
+        self._values = None
+        self._totals = None
+        self._marks = {}
+        self._compacted = 0
+        if columns is not None:
+            self._set_columns(columns)
+
+    def _set_columns(self, columns):
+        self.columns = pd.Index(columns)
+        self._column_key = columns
+        self._values = np.full((self._capacity, len(self.columns)), np.nan, dtype=self.dtype)
+        if self.cumulative:
+            self._totals = np.zeros((self._capacity, len(self.columns)), dtype=np.float64)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def empty(self):
+        return self._size == 0
+
+    @property
+    def index(self):
+        return pd.DatetimeIndex(self._index[:self._size])
+
+    @property
+    def values(self):
+        return self._values[:self._size] if self._values is not None else np.empty((0, 0), dtype=self.dtype)
+
+    @property
+    def nbytes(self):
+        # 已分配 (包括未使用容量) 的記憶體
+        return sum(array.nbytes for array in (self._index, self._values, self._totals) if array is not None)
+
+    def _grow(self, min_capacity):
+        capacity = max(self._capacity, 1)
+        while capacity < min_capacity:
+            capacity *= 2
+        index = np.empty(capacity, dtype="datetime64[ns]")
+        index[:self._size] = self._index[:self._size]
+        values = np.full((capacity, self._values.shape[1]), np.nan, dtype=self.dtype)
+        values[:self._size] = self._values[:self._size]
+        if self._totals is not None:
+            totals = np.zeros((capacity, self._totals.shape[1]), dtype=np.float64)
+            totals[:self._size] = self._totals[:self._size]
+            self._totals = totals
+        self._index, self._values, self._capacity = index, values, capacity
+
+    def _realign(self, columns):
+        # 欄位改變 (例如新增組合) 時合併欄位, 只在罕見情況下複製
+        columns = pd.Index(columns)
+        added = columns.difference(self.columns, sort=False)
+        merged = self.columns.append(added)
+        values = np.full((self._capacity, len(merged)), np.nan, dtype=self.dtype)
+        values[:self._size, :len(self.columns)] = self._values[:self._size]
+        if self._totals is not None:
+            totals = np.zeros((self._capacity, len(merged)), dtype=np.float64)
+            totals[:self._size] = np.nancumsum(values[:self._size], axis=0)
+            self._totals = totals
+        self.columns, self._values = merged, values
+        self._column_key = None
+        return merged.get_indexer(columns)
+
+    def append(self, time_now, row, columns=None):
+        row = np.asarray(row, dtype=self.dtype)
+        if self.columns is None:
+            self._set_columns(columns if columns is not None else np.arange(1, len(row) + 1))
+        positions = None
+        # 組合索引的欄位物件是共用的, 身份比較即可跳過逐欄比對
+        if columns is not None and columns is not self._column_key and not self.columns.equals(pd.Index(columns)):
+            positions = self.columns.get_indexer(columns)
+            if (positions < 0).any():
+                positions = self._realign(columns)
+        if self._size == self._capacity:
+            self._grow(self._size + 1)
+        self._index[self._size] = np.datetime64(time_now, "ns")
+        if positions is None:
+            self._values[self._size] = row
+        else:
+            self._values[self._size] = np.nan
+            self._values[self._size, positions] = row
+        self._advance()
+
+    def repeat_last(self, time_now):
+        # 以上一行的數值追加新的時間點
+        if self._size == self._capacity:
+            self._grow(self._size + 1)
+        self._index[self._size] = np.datetime64(time_now, "ns")
+        self._values[self._size] = self._values[self._size - 1]
+        self._advance()
+
+    def _advance(self):
+        # 新的一行已寫入 self._size, 更新累計和及登記的時間點
+        position = self._size
+        if self._totals is not None:
+            row = np.nan_to_num(self._values[position], nan=0.0, posinf=0.0, neginf=0.0)
+            self._totals[position] = self._totals[position - 1] + row if position else row
+        if self._marks:
+            time_now = self._index[position]
+            for cutoff in self._marks:
+                if time_now < cutoff:
+                    self._marks[cutoff] = position
+        self._size += 1
+
+    def set_marks(self, cutoffs):
+        # 登記時間點 (例如開跑前 25/5 分鐘); 開跑時間改變時重新登記, 一次二分搜尋後改為增量更新
+        cutoffs = [np.datetime64(cutoff, "ns") for cutoff in cutoffs]
+        if sorted(self._marks) == sorted(cutoffs):
+            return
+        index = self._index[:self._size]
+        self._marks = {cutoff: int(np.searchsorted(index, cutoff, side="left")) - 1 for cutoff in cutoffs}
+
+    def _position_before(self, cutoff):
+        cutoff = np.datetime64(cutoff, "ns")
+        position = self._marks.get(cutoff)
+        if position is None:
+            position = int(np.searchsorted(self._index[:self._size], cutoff, side="left")) - 1
+        return min(position, self._size - 1)
+
+    def row_before(self, cutoff):
+        # 最後一行早於 cutoff 的 (時間, 數值), 沒有則為 None
+        position = self._position_before(cutoff)
+        return (self._index[position], self._values[position]) if position >= 0 else None
+
+    def row_from(self, cutoff):
+        # 第一行不早於 cutoff 的 (時間, 數值), 沒有則為 None
+        position = self._position_before(cutoff) + 1
+        return (self._index[position], self._values[position]) if position < self._size else None
+
+    def compact(self, before, interval=None, min_rows=0):
+        # 早於 before 的行每 interval 秒只保留最後一行, interval 為 None 時全部捨棄;
+        # 登記的時間點前後的行 (row_before/row_from) 及最後的行一定保留, 圖表快照不受影響
+        # 累計的紀錄把捨棄的行併入下一個保留的行, 累計和不變; 返回捨棄的行數
+        index = self._index[:self._size]
+        old = int(np.searchsorted(index, np.datetime64(before, "ns"), side="left"))
+        # min_rows: 上次壓縮後新增的舊行達到此數目才重新分配
+        if not old or old - self._compacted < min_rows:
+            return 0
+        keep = np.ones(self._size, dtype=bool)
+        if interval is None:
+            keep[:old] = False
+        else:
+            buckets = index[:old].astype(np.int64) // int(interval * 1e9)
+            keep[:old] = np.append(buckets[1:] != buckets[:-1], True)
+        # 連前一行也保留, 累計的紀錄在這些行的數值不會被合併
+        for position in self._marks.values():
+            keep[max(position - 1, 0):position + 2] = True
+        keep[-2:] = True
+        rows = np.flatnonzero(keep)
+        if len(rows) == self._size:
+            self._compacted = old
+            return 0
+        # 快照視圖共用舊的陣列, 所以一定分配新的陣列而不是原地搬移
+        size = len(rows)
+        capacity = size + max(size // 2, 16)
+        new_index = np.empty(capacity, dtype="datetime64[ns]")
+        new_index[:size] = index[rows]
+        values = np.full((capacity, self._values.shape[1]), np.nan, dtype=self.dtype)
+        totals = None
+        if self._totals is not None:
+            totals = np.zeros((capacity, self._totals.shape[1]), dtype=np.float64)
+            totals[:size] = self._totals[rows]
+        values[:size] = self._values[rows]
+        if totals is not None:
+            merged = np.flatnonzero(np.diff(rows, prepend=-1) > 1)
+            values[merged] = np.diff(totals[:size], axis=0, prepend=0.0)[merged]
+        cutoffs = np.array(list(self._marks), dtype="datetime64[ns]")
+        marks = np.searchsorted(new_index[:size], cutoffs, side="left") - 1
+        dropped = self._size - size
+        # 一次替換所有欄位, 其他執行緒的 snapshot 不會讀到新舊混合的狀態
+        self.__dict__.update(
+            _index=new_index, _values=values, _totals=totals, _size=size, _capacity=capacity,
+            _marks=dict(zip(self._marks, marks.tolist())), _compacted=int((rows < old).sum()),
+        )
+        return dropped
+
+    def row_ago(self, n):
+        # 最後一行之前第 n 行的數值, 不足 n 行時為第一行
+        if not self._size:
+            return None
+        return self._values[max(self._size - 1 - n, 0)]
+
+    def window_sum(self, n):
+        # 最近 n 行的逐欄總和 (nan 當作 0), 只適用於 cumulative=True
+        if not self._size:
+            return None
+        end = self._totals[self._size - 1]
+        start = self._size - 1 - n
+        return end - self._totals[start] if start >= 0 else end.copy()
+
+    def snapshot(self):
+        # 固定長度的唯讀視圖, 共用底層陣列; 原本的紀錄之後追加不會影響這個視圖,
+        # 在視圖上追加會因容量已滿而先複製
+        view = HistoryStore.__new__(HistoryStore)
+        while True:
+            view.__dict__.update(self.__dict__)
+            # 收集器執行緒正在合併欄位時, 欄位與數值可能暫時不一致, 重新讀取
+            if view._values is None or (view._values.shape[1] == len(view.columns) and
+                                        (view._totals is None or view._totals.shape[1] == len(view.columns))):
+                break
+        view._capacity = view._size
+        view._marks = dict(view._marks)
+        return view
+
+    def last(self):
+        return self._values[self._size - 1] if self._size else None
+
+    def last_for(self, columns):
+        # 最後一行按 columns 的次序排列; 合併欄位 (例如馬匹數目增加) 後新的標籤排在最後,
+        # 按位置讀取的使用者 (每匹馬分攤, 異常偵測) 須按組合索引重新排列, 缺少的欄位為 nan
+        if not self._size:
+            return None
+        row = self._values[self._size - 1]
+        if columns is self._column_key or columns is self.columns:
+            return row
+        positions = self.columns.get_indexer(columns)
+        return np.where(positions >= 0, row[positions], np.nan).astype(self.dtype)
+
+    def last_time(self):
+        return self._index[self._size - 1] if self._size else None
+
+    def frame(self):
+        # 零複製的 DataFrame 視圖, 供圖表及表格使用
+        if self.columns is None:
+            return pd.DataFrame()
+        return pd.DataFrame(self.values, index=self.index, columns=self.columns, copy=False)
+
+    def tail(self, n=5):
+        if self.columns is None:
+            return pd.DataFrame()
+        start = max(self._size - n, 0)
+        return pd.DataFrame(
+            self._values[start:self._size],
+            index=pd.DatetimeIndex(self._index[start:self._size]),
+            columns=self.columns,
+            copy=False,
+        )
+
+def new_history_dict(methods, cumulative=False):
+    return {method: HistoryStore(cumulative=cumulative) for method in methods}
+
+def history_nbytes(history):
+    return sum(store.nbytes for stores in history.values() for store in stores.values())
@@ -0,0 +1,277 @@
+# http_client.py
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from recording import request_key
+from metrics import metrics
+from config import (
+    HEADERS, FETCH_TIMEOUT, FETCH_DEADLINE, FETCH_RETRIES, FETCH_RETRY_BACKOFF, FETCH_POOL_SIZE, FETCH_KEEPALIVE,
+    BREAKER_THRESHOLD, BREAKER_RESET, STALE_MAX_AGE,
+)
+
+try:
+    import orjson
+    loads_json = orjson.loads
+except ImportError:
+    import json
+    loads_json = json.loads
+
+# 所有 API 請求共用的客戶端: 連線池, 每個請求的總時限 (包括重試), 有限次數的退避重試,
+# 熔斷器 (連續失敗後暫停請求, 讓每個週期快速失敗) 及可選的過期數據後備
+# requests 及 aiohttp 在第一次請求時才載入 (各要數百毫秒), 只用其中一邊的程序不會載入另一邊
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class FetchError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class CircuitOpenError(FetchError):
+    pass
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        # 熔斷後等待 reset_timeout 秒, 之後只放行一個試探請求
+        # 返回放行時的狀態 ("closed" 或 "half-open"), 拒絕時返回 None
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return None
+            self._probing = True
+            return "half-open"
+
+    def end_probe(self):
+        # 試探請求沒有記錄成功或失敗便中止 (例如被取消) 時, 讓下一個請求可以再試探
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                if self.opened_at is None or self._probing:
+                    logging.warning(f"API circuit opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+class StaleCache:
+    # 每個請求最近一次成功的回應, 請求失敗時在 max_age 秒內可用作後備
+    def __init__(self, max_age=STALE_MAX_AGE, max_entries=128):
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key, data):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.max_age:
+            return None
+        return entry[1]
+
+breaker = CircuitBreaker()
+stale_cache = StaleCache()
+
+def _query_labels(payload):
+    # 統計標籤: 查詢類型及場次 (全場查詢為 all)
+    query = payload.get("query", "")
+    if "oddsNodes" in query:
+        kind = "odds"
+    elif "runners" in query:
+        kind = "race_info"
+    else:
+        kind = "investment"
+    return {"query": kind, "race": payload.get("variables", {}).get("raceNo", "all")}
+
+def _decode(content, labels):
+    metrics.observe_size("payload_bytes", len(content), **labels)
+    with metrics.timer("decode", **labels):
+        return loads_json(content)
+
+def _retry_delay(attempt, deadline):
+    # 第 attempt 次失敗後的等待秒數 (帶抖動); 超出重試次數或時限返回 None
+    if attempt >= FETCH_RETRIES:
+        return None
+    delay = FETCH_RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.0)
+    if time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+def _failed(error, retryable):
+    # 伺服器端的失敗才計入熔斷器, 4xx 表示端點仍然正常
+    if retryable:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return error
+
+def _with_stale(payload, stale_ok, fetch):
+    key = request_key(payload)
+    try:
+        data = fetch()
+    except FetchError as e:
+        stale = stale_cache.get(key) if stale_ok else None
+        if stale is None:
+            raise
+        logging.warning(f"Using stale response for {key} after error: {e}")
+        return stale
+    if stale_ok:
+        stale_cache.put(key, data)
+    return data
+
+def _reraise(error):
+    raise error
+
+# 同步請求: 共用 requests.Session 的連線池
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    global _session
+    import requests
+    from requests.adapters import HTTPAdapter
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(HEADERS)
+            _session.mount("http://", HTTPAdapter(pool_maxsize=FETCH_POOL_SIZE))
+            _session.mount("https://", HTTPAdapter(pool_maxsize=FETCH_POOL_SIZE))
+    return _session
+
+def _post_sync(url, payload):
+    import requests
+    deadline = time.monotonic() + FETCH_DEADLINE
+    labels = _query_labels(payload) if metrics.enabled else {}
+    attempt = 0
+    while True:
+        allowed = breaker.allow()
+        if not allowed:
+            raise CircuitOpenError("API circuit open")
+        timeout = min(FETCH_TIMEOUT, max(deadline - time.monotonic(), 0.1))
+        try:
+            with metrics.timer("fetch", **labels):
+                response = get_session().post(url, json=payload, timeout=timeout)
+            if response.status_code == 200:
+                data = _decode(response.content, labels)
+                breaker.record_success()
+                return data
+            retryable = response.status_code in RETRY_STATUS
+            error = _failed(FetchError(f"HTTP {response.status_code}", response.status_code), retryable)
+        except (requests.RequestException, ValueError) as e:
+            retryable = True
+            error = _failed(FetchError(f"{type(e).__name__}: {e}"), retryable)
+        finally:
+            # 其他例外 (例如 KeyboardInterrupt) 中止試探時, 熔斷器不會一直停在試探中
+            if allowed == "half-open":
+                breaker.end_probe()
+        delay = _retry_delay(attempt, deadline) if retryable else None
+        if delay is None:
+            raise error
+        time.sleep(delay)
+        attempt += 1
+
+def post_json(url, payload, stale_ok=False):
+    # 返回解碼後的 JSON; 失敗時拋出 FetchError, stale_ok 時改為返回最近一次成功的回應 (如有)
+    return _with_stale(payload, stale_ok, lambda: _post_sync(url, payload))
+
+# 非同步請求: 一條常駐事件迴圈 + 共用 keep-alive 連線池
+# Streamlit 每次 rerun 都在新的 script thread 執行, 所以 session 放在獨立的背景迴圈上,
+# 讓連線可以跨 rerun 重用
+_loop = None
+_loop_lock = threading.Lock()
+_async_session = None
+
+def get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="hkjc-fetch-loop", daemon=True).start()
+    return _loop
+
+def run_async(coro, timeout=None):
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+async def get_async_session():
+    global _async_session
+    import aiohttp
+    if _async_session is None or _async_session.closed:
+        connector = aiohttp.TCPConnector(limit=FETCH_POOL_SIZE, keepalive_timeout=FETCH_KEEPALIVE)
+        _async_session = aiohttp.ClientSession(connector=connector, headers=HEADERS)
+    return _async_session
+
+async def _post_async(url, payload):
+    import aiohttp
+    deadline = time.monotonic() + FETCH_DEADLINE
+    labels = _query_labels(payload) if metrics.enabled else {}
+    attempt = 0
+    while True:
+        allowed = breaker.allow()
+        if not allowed:
+            raise CircuitOpenError("API circuit open")
+        timeout = aiohttp.ClientTimeout(total=min(FETCH_TIMEOUT, max(deadline - time.monotonic(), 0.1)))
+        try:
+            session = await get_async_session()
+            started = time.perf_counter()
+            async with session.post(url, json=payload, timeout=timeout) as response:
+                if response.status == 200:
+                    content = await response.read()
+                    metrics.observe("fetch", time.perf_counter() - started, **labels)
+                    data = _decode(content, labels)
+                    breaker.record_success()
+                    return data
+                retryable = response.status in RETRY_STATUS
+                error = _failed(FetchError(f"HTTP {response.status}", response.status), retryable)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            retryable = True
+            error = _failed(FetchError(f"{type(e).__name__}: {e}"), retryable)
+        finally:
+            # 試探請求被取消 (asyncio.CancelledError) 時, 熔斷器不會一直停在試探中
+            if allowed == "half-open":
+                breaker.end_probe()
+        delay = _retry_delay(attempt, deadline) if retryable else None
+        if delay is None:
+            raise error
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def post_json_async(url, payload, stale_ok=False):
+    # 先等待請求完成, 結果或 FetchError 交由與 post_json 相同的 _with_stale 處理
+    try:
+        data = await _post_async(url, payload)
+    except FetchError as e:
+        return _with_stale(payload, stale_ok, lambda: _reraise(e))
+    return _with_stale(payload, stale_ok, lambda: data)
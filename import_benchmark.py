@@ -0,0 +1,62 @@
+# import_benchmark.py
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from statistics import median
+
+# 量度每個入口模組在全新 Python 程序中的 import 耗時及載入了哪些大型第三方套件, 輸出 JSON 方便追蹤退步
+# (Streamlit rerun 不會重新 import, 這裡量度的是冷啟動及 collector_daemon 工作程序的啟動)
+MODULES = ["config", "metrics", "http_client", "data_fetch", "archive", "collector", "visualization", "collector_daemon"]
+HEAVY = ["numpy", "pandas", "requests", "aiohttp", "orjson", "dateutil", "streamlit", "altair", "matplotlib"]
+PROBE = (
+    "import json, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import {module}\n"
+    "elapsed = time.perf_counter() - started\n"
+    "print(json.dumps({{'seconds': elapsed, 'loaded': [name for name in {heavy!r} if name in sys.modules]}}))\n"
+)
+
+def time_import(module, repeat):
+    samples, loaded = [], []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result["seconds"] * 1000)
+        loaded = result["loaded"]
+    return {
+        "module": module,
+        "median_ms": median(samples),
+        "min_ms": min(samples),
+        "max_ms": max(samples),
+        "loaded": loaded,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time of the app and collector modules")
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", help="把結果寫入 JSON 檔案 (預設輸出到 stdout)")
+    args = parser.parse_args(argv)
+
+    results = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "results": [time_import(module, args.repeat) for module in args.modules],
+    }
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
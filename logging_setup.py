@@ -0,0 +1,8 @@
+# logging_setup.py
+import logging
+from config import LOG_PATH
+
+# 唯一的 logging 設定: 由程式入口 (streamlit_app.py, collector_daemon.py, replay.py) 呼叫,
+# 其他模組只使用 logging, import 時不會開啟 app.log
+def setup_logging(path=LOG_PATH):
+    logging.basicConfig(filename=path, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -0,0 +1,173 @@
+# metrics.py
+import threading
+import time
+from collections import deque
+from config import METRICS_ENABLED, METRICS_SAMPLES
+
+# 每個處理階段的耗時, 回應大小及歷史紀錄大小
+# 階段: fetch (網絡), decode (JSON 解碼), save, fair_value, aggregate, anomaly, movers, feed, render, tick (整個收集週期)
+# 停用時 timer() 返回共用的空 context manager, observe()/set_gauge() 直接返回, 熱路徑幾乎沒有成本
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    def __init__(self, metrics, stage, labels):
+        self.metrics = metrics
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started, **self.labels)
+        return False
+
+class _Series:
+    # 累計次數/總和/最大值, 另保留最近的樣本計算百分位數
+    def __init__(self, samples):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=samples)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+def _quantile(values, q):
+    # 與 np.quantile 相同的線性插值; 不依賴 numpy, http_client 等 import 時不必載入它
+    values = sorted(values)
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def _key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _sample(name, key, value):
+    labels = ",".join(f'{label}="{text}"' for label, text in key)
+    return f"{name}{{{labels}}} {value}" if labels else f"{name} {value}"
+
+class Metrics:
+    def __init__(self, enabled=METRICS_ENABLED, samples=METRICS_SAMPLES):
+        self.enabled = enabled
+        self.samples = samples
+        self._timers = {}
+        self._sizes = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def timer(self, stage, **labels):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage, labels)
+
+    def observe(self, stage, seconds, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            series = self._timers.get((stage, _key(labels)))
+            if series is None:
+                series = self._timers[(stage, _key(labels))] = _Series(self.samples)
+            series.add(seconds)
+
+    def observe_size(self, name, size, **labels):
+        # 回應大小等累計數值 (bytes)
+        if not self.enabled:
+            return
+        with self._lock:
+            series = self._sizes.get((name, _key(labels)))
+            if series is None:
+                series = self._sizes[(name, _key(labels))] = _Series(self.samples)
+            series.add(size)
+
+    def set_gauge(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, _key(labels))] = value
+
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._sizes.clear()
+            self._gauges.clear()
+
+    def timer_rows(self):
+        # 給診斷面板: 每個 (階段, 標籤) 一行, 單位為毫秒
+        with self._lock:
+            items = [(stage, key, series.count, series.total, series.max, list(series.recent))
+                     for (stage, key), series in self._timers.items()]
+        rows = []
+        for stage, key, count, total, maximum, recent in sorted(items, key=lambda item: (item[0], item[1])):
+            rows.append({
+                "stage": stage,
+                **dict(key),
+                "count": count,
+                "mean_ms": total / count * 1000,
+                "p50_ms": _quantile(recent, 0.5) * 1000,
+                "p95_ms": _quantile(recent, 0.95) * 1000,
+                "max_ms": maximum * 1000,
+            })
+        return rows
+
+    def size_rows(self):
+        with self._lock:
+            sizes = [{"name": name, **dict(key), "count": series.count, "mean": series.total / series.count,
+                      "max": series.max} for (name, key), series in self._sizes.items()]
+            gauges = [{"name": name, **dict(key), "value": value} for (name, key), value in self._gauges.items()]
+        return sorted(sizes, key=lambda row: row["name"]), sorted(gauges, key=lambda row: row["name"])
+
+    def render_prometheus(self):
+        # Prometheus 文字格式: 耗時為 summary (秒), 大小為 summary (bytes), 歷史大小為 gauge
+        lines = []
+        with self._lock:
+            timers = sorted(self._timers.items())
+            sizes = sorted(self._sizes.items())
+            gauges = sorted(self._gauges.items())
+        if timers:
+            lines += ["# HELP race_stage_seconds Time spent in each pipeline stage",
+                      "# TYPE race_stage_seconds summary"]
+        for (stage, key), series in timers:
+            key = (("stage", stage),) + key
+            recent = list(series.recent)
+            for quantile in (0.5, 0.95):
+                lines.append(_sample("race_stage_seconds", key + (("quantile", quantile),), f"{_quantile(recent, quantile):.6f}"))
+            lines.append(_sample("race_stage_seconds_sum", key, f"{series.total:.6f}"))
+            lines.append(_sample("race_stage_seconds_count", key, series.count))
+        names = []
+        for (name, key), series in sizes:
+            if name not in names:
+                names.append(name)
+                lines += [f"# TYPE race_{name} summary"]
+            lines.append(_sample(f"race_{name}_sum", key, f"{series.total:.0f}"))
+            lines.append(_sample(f"race_{name}_count", key, series.count))
+        names = []
+        for (name, key), value in gauges:
+            if name not in names:
+                names.append(name)
+                lines += [f"# TYPE race_{name} gauge"]
+            lines.append(_sample(f"race_{name}", key, value))
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def record_history_sizes(race_no, history):
+    # 每場每個投注類型的歷史行數及已分配的記憶體
+    if not metrics.enabled:
+        return
+    for key, stores in history.items():
+        for pool, store in stores.items():
+            metrics.set_gauge("history_rows", len(store), race=race_no, kind=key, pool=pool)
+            metrics.set_gauge("history_bytes", store.nbytes, race=race_no, kind=key, pool=pool)
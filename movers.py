@@ -0,0 +1,51 @@
+# movers.py
+from collections import namedtuple
+import numpy as np
+from combination import plain_label
+from config import CHANGE_WINDOW, MOVERS_TOP_K
+
+# 熱門組合: 每個投注類型投注額增加最多及賠率下降最多的 K 個組合
+# 每個快照到達時只比較最後一行與 1 個 / window 個 tick 前的一行, 以 np.argpartition 選出前 K 個,
+# 不需掃描整段歷史; 收集器保存結果, 頁面以 O(K) 讀取
+# horizon: "tick" (上一個 tick) 或 "window" (最近 window 個 tick); rank_by: "investment" 或 "odds"
+Mover = namedtuple("Mover", ["pool", "horizon", "rank_by", "combination", "investment_change", "odds", "odds_change"])
+
+def _top(scores, k):
+    # 分數最大 (且大於 0) 的 k 個位置, 由大到小
+    scores = np.where(np.isfinite(scores), scores, -np.inf)
+    k = min(k, len(scores))
+    if not k:
+        return []
+    top = np.argpartition(scores, -k)[-k:]
+    top = top[np.argsort(scores[top])[::-1]]
+    return top[scores[top] > 0]
+
+def pool_movers(pool, investment_store, odds_store, k=MOVERS_TOP_K, window=CHANGE_WINDOW):
+    if len(investment_store) < 2 or odds_store is None or odds_store.empty:
+        return []
+    if len(odds_store.columns) != len(investment_store.columns):
+        return []
+    columns = investment_store.columns
+    investment = investment_store.last().astype(np.float64)
+    odds = odds_store.last().astype(np.float64)
+    movers = []
+    for horizon, n in (("tick", 1), ("window", window)):
+        investment_change = investment - investment_store.row_ago(n)
+        previous_odds = odds_store.row_ago(n)
+        # 退出馬匹 (inf) 及缺少的賠率得出 nan, 不會入選
+        with np.errstate(divide="ignore", invalid="ignore"):
+            odds_change = (odds - previous_odds) / previous_odds
+        for rank_by, scores in (("investment", investment_change), ("odds", -odds_change)):
+            movers += [
+                Mover(pool, horizon, rank_by, plain_label(columns[i]), float(investment_change[i]), float(odds[i]), float(odds_change[i]))
+                for i in _top(scores, k)
+            ]
+    return movers
+
+def top_movers(history, methodlist, k=MOVERS_TOP_K, window=CHANGE_WINDOW):
+    movers = []
+    for method in methodlist:
+        investment_store = history["investment_dict"].get(method)
+        if investment_store is not None:
+            movers += pool_movers(method, investment_store, history["odds_dict"].get(method), k, window)
+    return movers
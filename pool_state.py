@@ -0,0 +1,51 @@
+# pool_state.py
+from config import POOL_STOPPED_STATUSES
+
+# 每場賽事每個投注池的變動追蹤
+# 投注額查詢會返回每個投注池的 lastUpdateTime/status/sellStatus; 只有 lastUpdateTime 改變的投注池
+# 才需要重新抓取賠率節點. 明確停止投注後抓取一次最後賠率, 之後不再輪詢該投注池;
+# 暫停等其他狀態繼續輪詢. 沒有賠率節點的投注池同樣記下 lastUpdateTime, 只按 sellStatus 關閉
+class RacePoolState:
+    def __init__(self):
+        self.states = {}
+        self.seen = {}
+        self.odds = {}
+        self.closed = set()
+        self.field_size = None
+
+    def is_stopped(self, method):
+        state = self.states.get(method)
+        return state is not None and state[2] in POOL_STOPPED_STATUSES
+
+    def changed_methods(self, states, methodlist):
+        self.states = states
+        changed = []
+        for method in methodlist:
+            if method in self.closed or method not in states:
+                continue
+            if method not in self.seen or states[method][0] != self.seen[method]:
+                changed.append(method)
+            elif self.is_stopped(method):
+                # 停止投注後沒有再更新, 手上的已是最後賠率
+                self.closed.add(method)
+        return changed
+
+    def merge_odds(self, odds, methods):
+        # 把新抓取的賠率併入上一次的賠率, 返回完整的賠率 dict; odds 為 None (抓取失敗) 時下次重新抓取
+        for method in methods:
+            if not odds:
+                break
+            values = odds.get(method, [])
+            if len(values):
+                self.odds[method] = values
+            self.seen[method] = self.states[method][0]
+            if self.is_stopped(method):
+                self.closed.add(method)
+        if len(self.odds.get("WIN", [])):
+            self.field_size = len(self.odds["WIN"])
+        return dict(self.odds)
+
+    @property
+    def finished(self):
+        # 所有投注池都已停止投注並取得最後賠率
+        return bool(self.states) and all(method in self.closed for method in self.states)
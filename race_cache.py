@@ -0,0 +1,51 @@
+# race_cache.py
+import threading
+from collections import OrderedDict
+from config import RACE_CACHE_SIZE
+
+# 所有收集器及檢視器共用: 記憶體中歷史紀錄的 (日期, 場地, 場次) LRU
+# 超出容量時由最久沒有觀看的場次開始通知擁有者 release(race_no); 數據已在存檔, 再次選擇時才重新載入
+# 擁有者可拒絕 (例如仍在收集的場次), 這些場次留在原位, 不阻礙其他場次被釋放
+class RaceLRU:
+    def __init__(self, capacity=RACE_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def touch(self, key, owner):
+        # 觀看 (讀取快照) 時呼叫, 該場移到最近使用的一端
+        with self._lock:
+            self._entries[key] = owner
+            self._entries.move_to_end(key)
+        self._evict()
+
+    def add(self, key, owner):
+        # 載入但未被觀看的場次 (例如收集器自動收集的場次) 放在最先被釋放的一端
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = owner
+            self._entries.move_to_end(key, last=False)
+        self._evict()
+
+    def _evict(self):
+        # release 在鎖外呼叫, 擁有者可以取得自己的鎖
+        with self._lock:
+            excess = len(self._entries) - self.capacity
+            # 最近使用的一場不會被釋放
+            candidates = list(self._entries.items())[:-1] if excess > 0 else []
+        released = []
+        for key, owner in candidates:
+            if len(released) >= excess:
+                break
+            if owner.release(key[2]):
+                released.append(key)
+        if released:
+            with self._lock:
+                for key in released:
+                    self._entries.pop(key, None)
+
+race_cache = RaceLRU()
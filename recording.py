@@ -0,0 +1,43 @@
+# recording.py
+import hashlib
+import json
+import threading
+import time
+
+# 把 GraphQL 請求及回應逐行記錄為 JSONL, 供 replay.py 重播
+def request_key(payload):
+    # 同一個查詢 (operationName + query 內容 + 變數) 對應同一個 key
+    query = " ".join(payload.get("query", "").split())
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+    variables = json.dumps(payload.get("variables", {}), sort_keys=True, ensure_ascii=False)
+    return f"{payload.get('operationName')}:{digest}:{variables}"
+
+class ResponseRecorder:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+        # 由收集迴圈設定的週期編號, 重播時用來分組 tick
+        self.tick = None
+
+    def write(self, payload, data):
+        entry = {"ts": time.time(), "key": request_key(payload), "payload": payload, "response": data}
+        if self.tick is not None:
+            entry["tick"] = self.tick
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def load_recording(path):
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries
@@ -0,0 +1,295 @@
+# replay.py
+import argparse
+import bisect
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from dateutil import relativedelta as datere
+import data_fetch
+from collector import HISTORY_KEYS, collect_meeting, new_race_history
+from data_process import save_odds_data, save_investment_data, get_overall_investment
+from recording import ResponseRecorder, load_recording, request_key
+from logging_setup import setup_logging
+from config import METHOD_LIST_WITH_QPL
+
+# 本地 GraphQL 替身: 以記錄下來的回應回答 app 發出的同一批查詢
+# 每個查詢返回時間 <= 重播時鐘的最後一個回應; 時鐘可由回測程式逐 tick 設定, 或按倍速自行前進
+class ReplayServer:
+    def __init__(self, entries, host="127.0.0.1", port=0, speed=1.0):
+        self._times = {}
+        self._responses = {}
+        self._odds_keys = {}
+        for entry in entries:
+            self._times.setdefault(entry["key"], []).append(entry["ts"])
+            self._responses.setdefault(entry["key"], []).append(entry["response"])
+            if "oddsNodes" in entry["payload"].get("query", ""):
+                self._odds_keys.setdefault(self._odds_group(entry["key"], entry["payload"]), {})[entry["key"]] = \
+                    set(entry["payload"]["variables"].get("oddsTypes") or [])
+        self.start_ts = entries[0]["ts"] if entries else time.time()
+        self.speed = speed
+        self._fixed_clock = None
+        self._started = time.time()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/graphql/base/"
+
+    def set_clock(self, ts):
+        self._fixed_clock = ts
+
+    def clock(self):
+        if self._fixed_clock is not None:
+            return self._fixed_clock
+        return self.start_ts + (time.time() - self._started) * self.speed
+
+    @staticmethod
+    def _odds_group(key, payload):
+        variables = payload.get("variables", {})
+        return key.split(":", 2)[1], variables.get("date"), variables.get("venueCode"), variables.get("raceNo")
+
+    def _lookup(self, key):
+        times = self._times.get(key)
+        if not times:
+            return None
+        position = max(bisect.bisect_right(times, self.clock()) - 1, 0)
+        return self._responses[key][position]
+
+    def response_for(self, payload):
+        data = self._lookup(request_key(payload))
+        if data is None and "poolInvs" in payload.get("query", "") and "raceNo" in payload.get("variables", {}):
+            # 單場投注額查詢可由全場批量查詢的記錄按場次過濾得出
+            variables = payload["variables"]
+            meeting_payload = data_fetch._meeting_investment_payload(variables["date"], variables["venueCode"], variables["oddsTypes"])
+            meeting_data = self._lookup(request_key(meeting_payload))
+            if meeting_data is not None:
+                data = filter_race_investments(meeting_data, int(variables["raceNo"]))
+        if data is None and "oddsNodes" in payload.get("query", ""):
+            # 只查詢部分投注類型時, 由包含這些類型的記錄過濾得出
+            key = request_key(payload)
+            wanted = set(payload.get("variables", {}).get("oddsTypes") or [])
+            for candidate, odds_types in self._odds_keys.get(self._odds_group(key, payload), {}).items():
+                if wanted <= odds_types:
+                    recorded = self._lookup(candidate)
+                    data = filter_odds_types(recorded, wanted) if recorded is not None else None
+                    break
+        return data
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    payload = json.loads(self.rfile.read(length))
+                    data = server.response_for(payload)
+                except ValueError:
+                    data = None
+                status = 200 if data is not None else 404
+                if data is None:
+                    data = {"errors": [{"message": "No recorded response for this query"}]}
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="replay-server", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+def filter_race_investments(meeting_data, race_no):
+    meetings = []
+    for meeting in meeting_data.get("data", {}).get("raceMeetings", []) or []:
+        pools = [pool for pool in meeting.get("poolInvs", []) or []
+                 if [int(race) for race in (pool.get("leg") or {}).get("races") or []][:1] == [race_no]]
+        meetings.append(dict(meeting, poolInvs=pools))
+    return {"data": {"raceMeetings": meetings}}
+
+def filter_odds_types(odds_data, odds_types):
+    meetings = [dict(meeting, pmPools=[pool for pool in meeting.get("pmPools", []) or [] if pool.get("oddsType") in odds_types])
+                for meeting in odds_data.get("data", {}).get("raceMeetings", []) or []]
+    return {"data": {"raceMeetings": meetings}}
+
+def tick_times(entries, gap=5.0):
+    # 把回應分組成 tick, 每組取最後的時間, 使該 tick 的回應都已可見
+    # 有週期編號時按編號分組, 否則按時間間隔分組
+    ticks = []
+    last = None
+    for entry in entries:
+        group = entry.get("tick")
+        if ticks and (entry["ts"] - ticks[-1] <= gap if group is None else group == last):
+            ticks[-1] = entry["ts"]
+        else:
+            ticks.append(entry["ts"])
+        last = group
+    return ticks
+
+def recording_meeting(entries):
+    # 從記錄中找出日期, 場地及有賠率查詢的場次
+    date = venue = None
+    race_nos = set()
+    for entry in entries:
+        variables = entry["payload"].get("variables", {})
+        date = date or variables.get("date")
+        venue = venue or variables.get("venueCode")
+        if "oddsNodes" in entry["payload"].get("query", "") and "raceNo" in variables:
+            race_nos.add(int(variables["raceNo"]))
+    return date, venue, sorted(race_nos)
+
+# 回測策略: 每個 tick 如何抓取及處理數據
+def meeting_strategy(time_now, date, venue, race_nos, methodlist, race_history, pool_states):
+    # 只重新抓取有變動的投注池
+    return collect_meeting(time_now, date, venue, race_nos, methodlist, race_history, pool_states=pool_states)
+
+def meeting_full_strategy(time_now, date, venue, race_nos, methodlist, race_history, pool_states):
+    # 每個 tick 重新抓取所有投注池
+    return collect_meeting(time_now, date, venue, race_nos, methodlist, race_history)
+
+def single_race_strategy(time_now, date, venue, race_nos, methodlist, race_history, pool_states):
+    race_no = race_nos[0]
+    odds, investments = data_fetch.get_odds_and_investment_data(date, venue, race_no, methodlist)
+    if not len(odds.get("WIN", [])) or not investments.get("WIN"):
+        return []
+    history = race_history.setdefault(race_no, new_race_history(methodlist))
+    save_odds_data(time_now, odds, history["odds_dict"])
+    save_investment_data(time_now, investments, odds, history["investment_dict"])
+    get_overall_investment(time_now, history["investment_dict"], history["overall_investment_dict"], methodlist)
+    return [race_no]
+
+STRATEGIES = {"meeting": meeting_strategy, "meeting-full": meeting_full_strategy, "single": single_race_strategy}
+
+def history_rows(race_history):
+    return sum(len(store) for history in race_history.values() for key in HISTORY_KEYS for store in history[key].values())
+
+def run_replay(path, speed=None, strategy="meeting", race_nos=None, methodlist=METHOD_LIST_WITH_QPL):
+    # speed=None 時不等待, 盡快跑完整個記錄
+    entries = load_recording(path)
+    date, venue, recorded_races = recording_meeting(entries)
+    race_nos = race_nos or recorded_races
+    server = ReplayServer(entries)
+    original_url = data_fetch.API_URL
+    data_fetch.API_URL = server.start()
+    tick_fn = STRATEGIES[strategy]
+    race_history = {}
+    pool_states = {}
+    latencies = []
+    memory = []
+    ticks = tick_times(entries)
+    tracemalloc.start()
+    try:
+        for i, tick in enumerate(ticks):
+            if speed and i:
+                time.sleep((tick - ticks[i - 1]) / speed)
+            server.set_clock(tick)
+            time_now = datetime.fromtimestamp(tick) + datere.relativedelta(hours=8)
+            started = time.perf_counter()
+            tick_fn(time_now, date, venue, race_nos, methodlist, race_history, pool_states)
+            latencies.append(time.perf_counter() - started)
+            memory.append(tracemalloc.get_traced_memory()[0])
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        data_fetch.API_URL = original_url
+        server.stop()
+    latencies = np.array(latencies) * 1000
+    return {
+        "recording": path,
+        "strategy": strategy,
+        "date": date,
+        "venue": venue,
+        "races": race_nos,
+        "ticks": len(ticks),
+        "history_rows": history_rows(race_history),
+        "tick_ms": {
+            "mean": float(latencies.mean()) if len(latencies) else 0.0,
+            "p50": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "p95": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+            "max": float(latencies.max()) if len(latencies) else 0.0,
+        },
+        "memory_bytes": {
+            "start": memory[0] if memory else 0,
+            "end": memory[-1] if memory else 0,
+            "peak": peak,
+        },
+    }
+
+def record(path, date, venue, race_nos, interval, ticks, methodlist=METHOD_LIST_WITH_QPL):
+    # 對真實 API 收集 ticks 個週期並記錄所有回應
+    recorder = ResponseRecorder(path)
+    data_fetch.set_recorder(recorder)
+    race_history = {}
+    try:
+        for i in range(ticks):
+            started = time.time()
+            recorder.tick = i
+            time_now = datetime.now() + datere.relativedelta(hours=8)
+            updated = collect_meeting(time_now, date, venue, race_nos, methodlist, race_history)
+            logging.info(f"Recorded tick {i + 1}/{ticks} for {date} {venue}: races {updated}")
+            if i + 1 < ticks:
+                time.sleep(max(interval - (time.time() - started), 0))
+    finally:
+        data_fetch.set_recorder(None)
+        recorder.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record, serve and replay HKJC GraphQL responses")
+    sub = parser.add_subparsers(dest="command", required=True)
+    record_parser = sub.add_parser("record", help="記錄真實 API 回應")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--date", required=True)
+    record_parser.add_argument("--venue", required=True)
+    record_parser.add_argument("--races", type=int, nargs="+", default=list(range(1, 12)))
+    record_parser.add_argument("--interval", type=float, default=60)
+    record_parser.add_argument("--ticks", type=int, default=1)
+    serve_parser = sub.add_parser("serve", help="以本地替身伺服器重播記錄 (設定 HKJC_API_URL 指向它)")
+    serve_parser.add_argument("path")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--speed", type=float, default=1.0)
+    run_parser = sub.add_parser("run", help="回測: 加速重播並量度每個 tick 的延遲及記憶體")
+    run_parser.add_argument("path")
+    run_parser.add_argument("--speed", type=float, default=None)
+    run_parser.add_argument("--strategy", choices=sorted(STRATEGIES), nargs="+", default=["meeting"])
+    run_parser.add_argument("--races", type=int, nargs="+")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    if args.command == "record":
+        record(args.path, args.date, args.venue, args.races, args.interval, args.ticks)
+    elif args.command == "serve":
+        server = ReplayServer(load_recording(args.path), port=args.port, speed=args.speed)
+        server.start()
+        print(f"Replaying {args.path} at {server.url} (x{args.speed})")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.stop()
+    else:
+        results = [run_replay(args.path, args.speed, strategy, args.races) for strategy in args.strategy]
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# retention.py
+import logging
+from datetime import timedelta
+from history_store import history_nbytes
+from metrics import metrics
+from scheduler import to_local
+from config import HISTORY_FULL_MINUTES, HISTORY_DOWNSAMPLE, HISTORY_COMPACT_ROWS, HISTORY_MEMORY_BUDGET
+
+# 長賽日的歷史紀錄保留策略
+# 每個 tick 都抓取全場所有場次, 後面的場次在遠離開跑時已累積大量的行:
+# 開跑前 full_minutes 分鐘內保留每個 tick, 更早的每 interval 秒只保留一行
+# 所有場次超出 budget 時, 由已完結的場次 (場次由早到遲), 再由開跑最遲的場次開始只保留圖表快照及最後一行
+# 開跑前 25/5 分鐘的快照 (HistoryStore 登記的時間點) 一定保留; 完整的數據仍在存檔
+class RetentionPolicy:
+    def __init__(self, full_minutes=HISTORY_FULL_MINUTES, interval=HISTORY_DOWNSAMPLE,
+                 budget=HISTORY_MEMORY_BUDGET, min_rows=HISTORY_COMPACT_ROWS):
+        self.full_minutes = full_minutes
+        self.interval = interval
+        self.budget = budget
+        self.min_rows = min_rows
+
+    def boundary(self, time_now, post_time):
+        # 早於此時間的行會被降採樣; 未知開跑時間時以目前時間計算
+        post_time = to_local(post_time)
+        return (post_time if post_time is not None else time_now) - timedelta(minutes=self.full_minutes)
+
+    def apply(self, history, time_now, post_time):
+        # 必須在 mark_cutoffs 之後呼叫; 返回捨棄的行數
+        before = self.boundary(time_now, post_time)
+        return sum(
+            store.compact(before, self.interval, self.min_rows)
+            for stores in history.values() for store in stores.values()
+        )
+
+    def evict(self, history, time_now, post_time, finished):
+        # 已完結的場次只保留圖表快照及最後一行; 未完結的捨棄所有早於 boundary 的行
+        before = None if finished else self.boundary(time_now, post_time)
+        for stores in history.values():
+            for store in stores.values():
+                if not store.empty:
+                    store.compact(before if before is not None else store.last_time(), None)
+
+    def trim(self, race_history, time_now, post_times, race_finished):
+        # 每個收集週期呼叫: 降採樣每場的舊行, 超出記憶體上限時逐場清走
+        for race_no, history in list(race_history.items()):
+            self.apply(history, time_now, post_times.get(race_no))
+        sizes = {race_no: history_nbytes(history) for race_no, history in list(race_history.items())}
+        total = sum(sizes.values())
+        if total > self.budget:
+            order = sorted(sizes, key=lambda race_no: (0, race_no) if race_finished(race_no) else (1, -race_no))
+            for race_no in order:
+                if total <= self.budget:
+                    break
+                # 呼叫者沒有持有鎖時, 場次可能已被 race_cache 釋放
+                history = race_history.get(race_no)
+                if history is None:
+                    total -= sizes[race_no]
+                    continue
+                self.evict(history, time_now, post_times.get(race_no), race_finished(race_no))
+                size = history_nbytes(history)
+                logging.warning(f"History over budget, trimmed race {race_no} from {sizes[race_no]} to {size} bytes")
+                total += size - sizes[race_no]
+        metrics.set_gauge("history_total_bytes", total)
+        return total
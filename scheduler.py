@@ -0,0 +1,72 @@
+# scheduler.py
+import random
+from datetime import timedelta, timezone
+import numpy as np
+from config import POLL_SCHEDULE, POLL_INTERVAL_FAR, POLL_BACKOFF_BASE, POLL_BACKOFF_MAX
+
+# 按開跑時間決定輪詢間隔: 離開跑越近越密, 遠離開跑時稀疏輪詢
+# 連續失敗時以帶隨機抖動的指數退避, 避免在 API 出問題時持續密集請求
+def to_local(post_time):
+    # 開跑時間轉為與 time_now 相同的 UTC+8 無時區時間
+    if post_time is not None and post_time.tzinfo is not None:
+        post_time = post_time.astimezone(timezone.utc).replace(tzinfo=None) + timedelta(hours=8)
+    return post_time
+
+def chart_cutoffs(post_time):
+    # 開跑前 25 分鐘及 5 分鐘的時間點 (與 time_now 一樣為 UTC+8 的無時區時間)
+    post_time = to_local(post_time)
+    return np.datetime64(post_time - timedelta(minutes=25)), np.datetime64(post_time - timedelta(minutes=5))
+
+def mark_cutoffs(history, post_time):
+    # 在每個 HistoryStore 登記圖表的時間點, 之後追加時增量維護
+    if post_time is None:
+        return
+    cutoffs = chart_cutoffs(post_time)
+    for stores in history.values():
+        for store in stores.values():
+            store.set_marks(cutoffs)
+
+def poll_interval(time_now, post_time, schedule=POLL_SCHEDULE, far_interval=POLL_INTERVAL_FAR):
+    # schedule: [(開跑前分鐘數, 秒數)], 按分鐘數由小到大; 已過開跑時間用最密的間隔直至投注池關閉
+    post_time = to_local(post_time)
+    if post_time is None or not schedule:
+        return far_interval
+    minutes = (post_time - time_now).total_seconds() / 60
+    for within, seconds in schedule:
+        if minutes <= within:
+            return seconds
+    return far_interval
+
+def backoff_delay(failures, base=POLL_BACKOFF_BASE, cap=POLL_BACKOFF_MAX):
+    # 連續失敗 n 次後的等待秒數: 上限內的指數退避, 一半固定一半隨機
+    delay = min(cap, base * 2 ** max(failures - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class PollScheduler:
+    def __init__(self, schedule=POLL_SCHEDULE, far_interval=POLL_INTERVAL_FAR):
+        self.schedule = schedule
+        self.far_interval = far_interval
+        self.post_times = {}
+        self.failures = 0
+
+    @classmethod
+    def fixed(cls, interval):
+        # 固定間隔輪詢 (不理會開跑時間)
+        return cls(schedule=[], far_interval=interval)
+
+    def set_post_times(self, post_time_dict):
+        self.post_times = dict(post_time_dict or {})
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_error(self):
+        self.failures += 1
+
+    def next_delay(self, time_now, race_nos):
+        # race_nos: 仍有投注池在售的場次; 取最接近開跑的一場決定間隔
+        if self.failures:
+            return backoff_delay(self.failures)
+        intervals = [poll_interval(time_now, self.post_times.get(race_no), self.schedule, self.far_interval)
+                     for race_no in race_nos]
+        return min(intervals) if intervals else self.far_interval
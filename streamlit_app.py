@@ -7,30 +7,39 @@ except ImportError:
 import pandas as pd
 from datetime import datetime, timedelta
 from dateutil import relativedelta as datere
-from data_fetch import get_investment_data, get_odds_data, get_race_info_sync
-from data_process import save_odds_data, save_investment_data, get_overall_investment, get_weird_data
 from visualization import print_bar_chart
+from scheduler import poll_interval
+from metrics import metrics
+from logging_setup import setup_logging
 from config import (
     VENUE_OPTIONS, RACE_NUMBERS, METHOD_LIST_WITH_QPL, METHOD_LIST_WITHOUT_QPL,
-    METHOD_CH_WITH_QPL, METHOD_CH_WITHOUT_QPL, PRINT_LIST_WITH_QPL, PRINT_LIST_WITHOUT_QPL, BENCHMARK_DICT
+    METHOD_CH_WITH_QPL, METHOD_CH_WITHOUT_QPL, PRINT_LIST_WITH_QPL, PRINT_LIST_WITHOUT_QPL, BENCHMARK_DICT,
+    ARCHIVE_PATH, ARCHIVE_BATCH_SIZE, COLLECTOR_MODE, REFRESH_MIN_INTERVAL, ALERT_DISPLAY, CHANGE_WINDOW
 )
-def get_investment_data_sync(Date, place, race_no, methodlist):
-    return get_investment_data(Date, place, race_no, methodlist)
-def get_odds_data_sync(Date, place, race_no, methodlist):
-    return get_odds_data(Date, place, race_no, methodlist)
+setup_logging()
+# 抓取, 收集及存檔的模組在第一次用到時才載入, 頁面先顯示輸入介面
+# (external 模式不會載入 HTTP 客戶端)
+@st.cache_data(ttl=60)
+def get_race_info(Date, place):
+    from data_fetch import get_race_info_sync
+    return get_race_info_sync(Date, place)
+@st.cache_resource
+def get_archive():
+    from archive import SnapshotArchive
+    return SnapshotArchive(ARCHIVE_PATH, batch_size=ARCHIVE_BATCH_SIZE)
+# 每個 (日期, 場地) 一個共用的背景收集器, 所有 session 共用同一組請求及歷史紀錄
+# external 模式下由 collector_daemon.py 負責收集, 這裡只讀取存檔
+@st.cache_resource
+def get_collector(Date, place):
+    if COLLECTOR_MODE == "external":
+        from archive import ArchiveViewer
+        return ArchiveViewer(get_archive(), str(Date), place, METHOD_LIST_WITH_QPL)
+    from collector import MeetingCollector
+    return MeetingCollector(Date, place, METHOD_LIST_WITH_QPL, get_archive())
 # 設置頁面配置
 st.set_page_config(page_title="Jockey Race", layout="wide")
 st.title("Jockey Race 賽馬程式")
 # 初始化 session state
-if "odds_dict" not in st.session_state:
-    st.session_state.odds_dict = {method: pd.DataFrame() for method in METHOD_LIST_WITH_QPL}
-if "investment_dict" not in st.session_state:
-    st.session_state.investment_dict = {method: pd.DataFrame() for method in METHOD_LIST_WITH_QPL}
-if "overall_investment_dict" not in st.session_state:
-    st.session_state.overall_investment_dict = {method: pd.DataFrame() for method in METHOD_LIST_WITH_QPL}
-    st.session_state.overall_investment_dict["overall"] = pd.DataFrame()
-if "diff_dict" not in st.session_state:
-    st.session_state.diff_dict = {method: pd.DataFrame() for method in METHOD_LIST_WITH_QPL}
 if "race_dataframes" not in st.session_state:
     st.session_state.race_dataframes = {}
 if "numbered_dict" not in st.session_state:
@@ -61,9 +70,10 @@ methodCHlist = METHOD_CH_WITH_QPL
 print_list = PRINT_LIST_WITH_QPL
 # 獲取並優先顯示賽事資訊 (觸發於開始按鈕)
 if st.button("開始"):
+    from data_fetch import RaceInfoError
     st.session_state.reset = True
     try:
-        race_dict, post_time_dict = get_race_info_sync(Date, place)
+        race_dict, post_time_dict = get_race_info(Date, place)
         st.session_state.post_time_dict = post_time_dict
         st.session_state.race_dataframes = {}
         st.session_state.numbered_dict = {}
@@ -76,6 +86,9 @@ if st.button("開始"):
                 numbered_list = [f"{i+1}. {name}" for i, name in enumerate(race_dict[race_number]["馬名"])]
                 st.session_state.numbered_dict[race_number] = numbered_list
                 st.session_state.race_dataframes[race_number] = df
+    except RaceInfoError as e:
+        st.error(str(e))
+        st.session_state.reset = False
     except Exception as e:
         st.error(f"無法獲取賽事資訊: {e}")
         st.session_state.reset = False
@@ -99,26 +112,79 @@ if race_no and st.session_state.get("reset", False):
             st.warning(f"場次 {race_no} 無可用數據。請確認場次或稍後重試。")
 # 自動更新賠率和投注數據 (觸發於選定場次)
 if st.session_state.get("reset", False) and race_no:
-    st_autorefresh(interval=60000, key="data_refresh")
+    # 共用收集器每個週期收集全場所有場次, 這裡只讀取選定場次的快照
+    # 收集器啟動時會從本地存檔還原之前收集的歷史
+    collector = get_collector(Date, place)
+    collector.set_races(list(st.session_state.post_time_dict) or [race_no], st.session_state.post_time_dict)
+    # 刷新間隔跟隨開跑時間 (越接近開跑越密), 該場投注池全部關閉後不再刷新
+    if not collector.race_finished(race_no):
+        refresh_seconds = poll_interval(
+            datetime.now() + datere.relativedelta(hours=8), st.session_state.post_time_dict.get(race_no)
+        )
+        st_autorefresh(interval=max(int(refresh_seconds * 1000), REFRESH_MIN_INTERVAL), key="data_refresh")
     with st.container():
         st.subheader("賠率與投注數據")
-        time_now = datetime.now() + datere.relativedelta(hours=8)
         try:
-            odds = get_odds_data_sync(Date, place, race_no, methodlist)
-            investments = get_investment_data_sync(Date, place, race_no, methodlist)
-            if odds and investments:
-                save_odds_data(time_now, odds, st.session_state.odds_dict)
-                save_investment_data(time_now, investments, odds, st.session_state.investment_dict)
-                get_overall_investment(time_now, st.session_state.investment_dict, st.session_state.overall_investment_dict, methodlist)
-                st.write(st.session_state.overall_investment_dict)
-                get_weird_data(st.session_state.investment_dict,st.session_state.odds_dict,methodlist)
+            collector.ensure_running()
+            history = collector.snapshot(race_no)
+            time_now = collector.last_tick or datetime.now() + datere.relativedelta(hours=8)
+            if history and not history["odds_dict"]["WIN"].empty:
+                st.write({method: store.frame() for method, store in history["overall_investment_dict"].items()})
+                # 異常投注 (由收集器每個 tick 偵測), 最新的排在最前
+                alerts = collector.alerts(race_no)[-ALERT_DISPLAY:][::-1]
+                if alerts:
+                    st.write("異常投注")
+                    names = st.session_state.numbered_dict.get(race_no, [])
+                    st.dataframe(pd.DataFrame({
+                        "時間": [alert.time.strftime("%H:%M:%S") for alert in alerts],
+                        "投注類型": [methodCHlist[methodlist.index(alert.pool)] for alert in alerts],
+                        "馬匹": [names[alert.horse - 1] if alert.horse <= len(names) else str(alert.horse) for alert in alerts],
+                        "額外投注 (千)": [alert.amount for alert in alerts],
+                        "基準": [alert.benchmark for alert in alerts],
+                    }), hide_index=True)
+                # 熱門組合 (收集器每個 tick 更新), 每個投注類型投注增加及賠率下降最多的組合
+                movers = collector.movers(race_no)
+                if movers:
+                    with st.expander("熱門組合"):
+                        pools = [method for method in methodlist if any(mover.pool == method for mover in movers)]
+                        pool = st.selectbox("投注類型:", pools, format_func=lambda method: methodCHlist[methodlist.index(method)], key="movers_pool")
+                        rows = [mover for mover in movers if mover.pool == pool]
+                        st.dataframe(pd.DataFrame({
+                            "範圍": ["上次更新" if mover.horizon == "tick" else f"最近 {CHANGE_WINDOW} 次" for mover in rows],
+                            "排名": ["投注增加" if mover.rank_by == "investment" else "賠率下降" for mover in rows],
+                            "組合": [str(mover.combination) for mover in rows],
+                            "投注變動 (千)": [round(mover.investment_change, 2) for mover in rows],
+                            "賠率": [round(mover.odds, 2) for mover in rows],
+                            "賠率變動 (%)": [round(mover.odds_change * 100, 1) for mover in rows],
+                        }), hide_index=True)
                 for method in print_list:
                     st.write(f"{methodCHlist[methodlist.index(method)]} 圖表")
-                    print_bar_chart(
-                        time_now, st.session_state.overall_investment_dict, st.session_state.odds_dict,
-                        method, race_no, st.session_state.numbered_dict, st.session_state.post_time_dict
-                    )
+                    with metrics.timer("render", race=race_no, pool=method):
+                        print_bar_chart(
+                            time_now, history["overall_investment_dict"], history["odds_dict"],
+                            method, race_no, st.session_state.numbered_dict, st.session_state.post_time_dict,
+                            history["diff_dict"], Date, place
+                        )
+            elif collector.last_tick is None and collector.last_error is None:
+                st.info("正在收集數據，請稍候…")
             else:
                 st.error("無法獲取賠率或投注數據，請檢查輸入或網路連線")
         except Exception as e:
             st.error(f"數據更新失敗: {e}")
+# 診斷面板: 各處理階段耗時, 回應大小及歷史紀錄大小 (RACE_METRICS=0 停用)
+if metrics.enabled:
+    with st.expander("診斷"):
+        if COLLECTOR_MODE == "external":
+            st.caption("收集數據由 collector_daemon.py 負責, 其統計可經 --metrics-port 的 /metrics 讀取")
+        timer_rows = metrics.timer_rows()
+        if timer_rows:
+            st.write("各階段耗時 (毫秒)")
+            st.dataframe(pd.DataFrame(timer_rows), hide_index=True)
+        size_rows, gauge_rows = metrics.size_rows()
+        if size_rows:
+            st.write("回應大小 (bytes)")
+            st.dataframe(pd.DataFrame(size_rows), hide_index=True)
+        if gauge_rows:
+            st.write("歷史紀錄大小")
+            st.dataframe(pd.DataFrame(gauge_rows), hide_index=True)
+        st.download_button("下載 Prometheus 指標", metrics.render_prometheus(), file_name="metrics.prom", mime="text/plain")
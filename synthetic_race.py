@@ -0,0 +1,100 @@
+# synthetic_race.py
+import json
+from itertools import permutations
+import numpy as np
+from combination import ORDERED_METHODS, get_combination_index
+
+# 合成的 pmPools 回應, 供基準測試及重播使用
+# 每場 6-14 匹馬, 包括完整的 QIN/QPL/FCT/TRI/FF 組合, 退出馬匹的賠率為 SCR
+POOL_TOTALS = {"WIN": 8e6, "PLA": 9e6, "QIN": 1.2e7, "QPL": 6e6, "FCT": 2e6, "TRI": 3e6, "FF": 1.5e6}
+
+def harville(win_probs, runners, ordered):
+    # runners: (n_comb, k) 馬號陣列; 無次序時把所有排列的 Harville 概率相加
+    p = np.concatenate([[0.0], win_probs])
+    size = runners.shape[1]
+    orders = [tuple(range(size))] if ordered else list(permutations(range(size)))
+    total = np.zeros(len(runners))
+    for order in orders:
+        chosen = p[runners[:, order]]
+        remaining = 1.0 - np.concatenate([np.zeros((len(runners), 1)), np.cumsum(chosen, axis=1)[:, :-1]], axis=1)
+        total += np.prod(chosen / np.clip(remaining, 1e-9, None), axis=1)
+    return total
+
+def _format_odds(values):
+    return ["SCR" if not np.isfinite(value) else f"{min(max(value, 1.0), 9999.0):.1f}" for value in values]
+
+class SyntheticRace:
+    def __init__(self, runners=14, scratched=(), race_no=1, date="2025-01-01", venue="ST", seed=0):
+        self.runners = runners
+        self.scratched = set(scratched)
+        self.race_no = race_no
+        self.date = date
+        self.venue = venue
+        self.rng = np.random.default_rng(seed)
+        self.win_probs = self.rng.dirichlet(np.full(runners, 2.0))
+        self._normalise()
+        self.tick = 0
+
+    def _normalise(self):
+        for horse in self.scratched:
+            self.win_probs[horse - 1] = 0.0
+        self.win_probs /= self.win_probs.sum()
+
+    def _pool_id(self, method):
+        return f"{self.date.replace('-', '')}{self.venue}{self.race_no:02d}{method}"
+
+    def advance(self):
+        # 每個 tick 概率隨機漂移, 投注總額按比例增加
+        self.win_probs *= self.rng.lognormal(0.0, 0.05, self.runners)
+        self._normalise()
+        self.tick += 1
+
+    def odds(self, method):
+        scratched = np.array(sorted(self.scratched), dtype=np.uint8)
+        index = get_combination_index(method, self.runners)
+        if method == "WIN":
+            probs = self.win_probs.copy()
+        elif method == "PLA":
+            probs = np.minimum(self.win_probs * 3.0, 0.95)
+        elif method == "QPL":
+            probs = np.minimum(harville(self.win_probs, index.runners, False) * 3.0, 0.95)
+        else:
+            probs = harville(self.win_probs, index.runners, method in ORDERED_METHODS)
+        with np.errstate(divide="ignore"):
+            values = 0.825 / probs
+        if len(scratched):
+            values[np.isin(index.runners, scratched).any(axis=1)] = np.inf
+        return index, values
+
+    def odds_payload(self, methodlist):
+        pools = []
+        for method in methodlist:
+            index, values = self.odds(method)
+            labels = [",".join(f"{horse:02d}" for horse in combo) for combo in index.runners.tolist()]
+            nodes = [
+                {"combString": label, "oddsValue": value}
+                for label, value in zip(labels, _format_odds(values))
+            ]
+            pools.append({
+                "id": self._pool_id(method), "status": "START_SELL", "sellStatus": "START_SELL", "oddsType": method,
+                "lastUpdateTime": f"{self.date}T12:00:{self.tick % 60:02d}+08:00", "leg": {"number": 1, "races": [self.race_no]},
+                "oddsNodes": nodes,
+            })
+        return {"data": {"raceMeetings": [{"pmPools": pools}]}}
+
+    def investment_payload(self, methodlist):
+        growth = 1.0 + 0.01 * self.tick
+        pools = [{
+            "id": self._pool_id(method), "leg": {"number": 1, "races": [self.race_no]}, "status": "START_SELL",
+            "sellStatus": "START_SELL", "oddsType": method, "investment": f"{POOL_TOTALS[method] * growth:.0f}",
+            "mergedPoolId": None, "lastUpdateTime": f"{self.date}T12:00:{self.tick % 60:02d}+08:00",
+        } for method in methodlist]
+        total = sum(POOL_TOTALS[method] * growth for method in methodlist)
+        return {"data": {"raceMeetings": [{"totalInvestment": f"{total:.0f}", "poolInvs": pools}]}}
+
+    def encoded(self, methodlist):
+        # 與 HTTP 回應相同的 JSON bytes
+        return (
+            json.dumps(self.odds_payload(methodlist)).encode("utf-8"),
+            json.dumps(self.investment_payload(methodlist)).encode("utf-8"),
+        )
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+import numpy as np
+from anomaly import detect_anomalies
+from combination import get_combination_index
+from data_process import save_odds_data
+from history_store import new_history_dict
+
+START = datetime(2025, 1, 1, 12, 0)
+BENCHMARKS = {"WIN": 1.0, "QIN": 1.0}
+QIN_ODDS = {"01,02": 5.0, "01,03": 8.0, "02,03": 20.0, "01,04": 12.0, "02,04": 30.0, "03,04": 60.0}
+
+def _odds(field_size):
+    # 已有組合的賠率不變, 新增的馬匹帶來新的組合
+    index = get_combination_index("QIN", field_size)
+    qin = np.array([QIN_ODDS[label] for label in index.columns])
+    return {"WIN": np.array([2.0, 4.0, 8.0, 16.0][:field_size]), "QIN": qin}
+
+def _tick(tick, field_size, odds_dict, diff_dict):
+    odds = _odds(field_size)
+    time_now = START + timedelta(seconds=30 * tick)
+    investments = {"WIN": [500000.0], "QIN": [800000.0]}
+    alerts = detect_anomalies(time_now, 1, odds, investments, odds_dict, diff_dict, BENCHMARKS)
+    save_odds_data(time_now, odds, odds_dict)
+    return alerts
+
+def test_unchanged_odds_raise_no_alerts():
+    odds_dict = new_history_dict(["WIN", "QIN"])
+    diff_dict = new_history_dict(["WIN", "QIN", "overall"], cumulative=True)
+    for tick in range(3):
+        assert _tick(tick, 4, odds_dict, diff_dict) == []
+    np.testing.assert_array_equal(diff_dict["overall"].last(), np.zeros(4))
+
+def test_field_size_change_compares_matching_combinations():
+    odds_dict = new_history_dict(["WIN", "QIN"])
+    diff_dict = new_history_dict(["WIN", "QIN", "overall"], cumulative=True)
+    assert _tick(0, 3, odds_dict, diff_dict) == []
+    # 3 匹馬增加至 4 匹: 賠率紀錄的欄位次序與組合索引不同, 已有組合的賠率沒有變動
+    assert _tick(1, 4, odds_dict, diff_dict) == []
+    np.testing.assert_array_equal(diff_dict["QIN"].last(), np.zeros(4))
+    assert _tick(2, 4, odds_dict, diff_dict) == []
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+import numpy as np
+from archive import SnapshotArchive
+from collector import new_race_history, repeat_last_tick
+
+START = datetime(2025, 1, 1, 12, 0)
+METHODS = ["WIN", "QIN"]
+
+def _record_ticks(archive, ticks=6):
+    # 奇數 tick 沒有更新 (重複上一行), 偶數 tick 有新的賠率
+    history = new_race_history(METHODS)
+    rng = np.random.default_rng(0)
+    for tick in range(ticks):
+        time_now = START + timedelta(seconds=30 * tick)
+        if tick % 2:
+            repeat_last_tick(time_now, history)
+        else:
+            history["odds_dict"]["WIN"].append(time_now, rng.uniform(2, 50, 3), [1, 2, 3])
+            history["odds_dict"]["QIN"].append(time_now, np.array([10.0, np.nan, np.inf]), ["01,02", "01,03", "02,03"])
+            history["diff_dict"]["WIN"].append(time_now, rng.uniform(0, 100, 3), [1, 2, 3])
+        archive.record_race("2025-01-01", "ST", 1, history, time_now)
+    archive.flush()
+    return history
+
+def test_repeated_rows_are_written_as_markers(tmp_path):
+    archive = SnapshotArchive(str(tmp_path / "archive.sqlite"))
+    _record_ticks(archive)
+    rows, repeats = archive._conn.execute(
+        'SELECT COUNT(*), SUM(LENGTH("values") = 0) FROM snapshots WHERE kind = ? AND pool = ?', ("odds", "WIN")
+    ).fetchone()
+    assert (rows, repeats) == (6, 3)
+    archive.close()
+
+def test_markers_reload_as_repeated_rows(tmp_path):
+    archive = SnapshotArchive(str(tmp_path / "archive.sqlite"))
+    history = _record_ticks(archive)
+    loaded = archive.load_race_history("2025-01-01", "ST", 1, METHODS)
+    for key, pool in (("odds_dict", "WIN"), ("odds_dict", "QIN"), ("diff_dict", "WIN")):
+        original, store = history[key][pool], loaded[key][pool]
+        assert list(store.index) == list(original.index)
+        np.testing.assert_array_equal(store.values, original.values.astype(np.float64))
+    np.testing.assert_allclose(loaded["diff_dict"]["WIN"].window_sum(3), history["diff_dict"]["WIN"].window_sum(3))
+    archive.close()
+
+def test_first_row_after_reopen_is_written_in_full(tmp_path):
+    path = str(tmp_path / "archive.sqlite")
+    archive = SnapshotArchive(path)
+    history = _record_ticks(archive, ticks=1)
+    archive.close()
+    archive = SnapshotArchive(path)
+    time_now = START + timedelta(seconds=30)
+    repeat_last_tick(time_now, history)
+    archive.record_race("2025-01-01", "ST", 1, history, time_now)
+    archive.flush()
+    lengths = [row[0] for row in archive._conn.execute(
+        'SELECT LENGTH("values") FROM snapshots WHERE kind = ? AND pool = ? ORDER BY ts', ("odds", "WIN"))]
+    assert lengths == [24, 24]
+    archive.close()
@@ -0,0 +1,47 @@
+import threading
+import time
+import collector
+from archive import SnapshotArchive
+from collector import MeetingCollector, new_race_history
+from race_cache import RaceLRU
+
+def _slow_collect(time_now, Date, place, race_nos, methodlist, race_history, *args):
+    # 代替網絡請求: 等待一段時間後為每場建立空的歷史紀錄
+    time.sleep(0.2)
+    for race_no in race_nos:
+        race_history.setdefault(race_no, new_race_history(methodlist))
+    return []
+
+def test_first_ticks_do_not_deadlock_on_shared_cache(tmp_path, monkeypatch):
+    cache = RaceLRU(capacity=2)
+    monkeypatch.setattr(collector, "race_cache", cache)
+    monkeypatch.setattr(collector, "collect_meeting", _slow_collect)
+    archive = SnapshotArchive(str(tmp_path / "archive.sqlite"))
+    collectors = [MeetingCollector("2025-01-01", venue, ["WIN"], archive=archive, interval=60) for venue in ("ST", "HV")]
+    for meeting in collectors:
+        meeting.set_races([1, 2])
+        # 不再收集的舊場次, 可被 race_cache 釋放
+        meeting.race_history[9] = new_race_history(["WIN"])
+        cache.add(meeting._cache_key(9), meeting)
+    threads = [threading.Thread(target=meeting.ensure_running, daemon=True) for meeting in collectors]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads)
+    for meeting in collectors:
+        assert meeting.last_tick is not None
+    archive.close()
+
+def test_release_skips_busy_collector(tmp_path):
+    archive = SnapshotArchive(str(tmp_path / "archive.sqlite"))
+    meeting = MeetingCollector("2025-01-01", "ST", ["WIN"], archive=archive, interval=60)
+    meeting.race_history[9] = new_race_history(["WIN"])
+    holder = threading.Thread(target=lambda: (meeting._lock.acquire(), time.sleep(0.5), meeting._lock.release()))
+    holder.start()
+    time.sleep(0.1)
+    assert meeting.release(9) is False
+    holder.join()
+    assert meeting.release(9) is True
+    assert 9 not in meeting.race_history
+    archive.close()
@@ -0,0 +1,26 @@
+import asyncio
+import data_fetch
+from data_fetch import _parse_meeting_investment_data, _parse_odds_data, get_meeting_odds_async
+from synthetic_race import SyntheticRace
+
+METHODS = ["WIN", "QIN"]
+ERROR_BODY = {"data": None, "errors": [{"message": "Internal error"}]}
+
+def test_null_payload_parses_as_empty():
+    odds = _parse_odds_data(ERROR_BODY, "ST")
+    assert not any(len(values) for values in odds.values())
+    investments, states = _parse_meeting_investment_data(ERROR_BODY, "ST", [1, 2])
+    assert states == {1: {}, 2: {}}
+    assert not any(investments[1].values())
+
+def test_bad_race_response_only_drops_that_race(monkeypatch):
+    good = SyntheticRace(runners=6, race_no=1).odds_payload(METHODS)
+    responses = {1: good, 2: ERROR_BODY, 3: {"data": {"raceMeetings": [{"pmPools": [None]}]}}}
+
+    async def post(payload):
+        return 200, responses[payload["variables"]["raceNo"]]
+
+    monkeypatch.setattr(data_fetch, "_post_json", post)
+    odds_by_race = asyncio.run(get_meeting_odds_async("2025-01-01", "ST", {1: METHODS, 2: METHODS, 3: METHODS}))
+    assert list(odds_by_race) == [1]
+    assert len(odds_by_race[1]["WIN"]) == 6 and len(odds_by_race[1]["QIN"]) == 15
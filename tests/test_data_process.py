@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta
+import numpy as np
+from combination import get_combination_index
+from data_process import get_overall_investment
+from history_store import new_history_dict
+
+START = datetime(2025, 1, 1, 12, 0)
+
+def _pools(field_size, qin):
+    # 每個 QIN 組合的投注額 (千), 其他組合為 0
+    index = get_combination_index("QIN", field_size)
+    row = np.zeros(len(index))
+    for label, amount in qin.items():
+        row[index.ids[label]] = amount
+    return {"WIN": (np.zeros(field_size), get_combination_index("WIN", field_size).columns), "QIN": (row, index.columns)}
+
+def test_per_horse_totals_follow_field_size_change():
+    investment_dict = new_history_dict(["WIN", "QIN"])
+    overall_dict = new_history_dict(["WIN", "QIN", "overall"])
+    # 3 匹馬增加至 4 匹: QIN 紀錄的欄位合併為 01,02 01,03 02,03 01,04 02,04 03,04
+    for tick, (field_size, qin) in enumerate([(3, {"01,02": 4.0}), (4, {"01,04": 10.0})]):
+        time_now = START + timedelta(seconds=30 * tick)
+        for method, (row, columns) in _pools(field_size, qin).items():
+            investment_dict[method].append(time_now, row, columns)
+        get_overall_investment(time_now, investment_dict, overall_dict, ["WIN", "QIN"])
+    assert list(investment_dict["QIN"].columns) != list(get_combination_index("QIN", 4).columns)
+    np.testing.assert_array_equal(overall_dict["QIN"].last(), [5.0, 0.0, 0.0, 5.0])
+    np.testing.assert_array_equal(overall_dict["overall"].last(), [5.0, 0.0, 0.0, 5.0])
@@ -0,0 +1,73 @@
+from itertools import permutations
+import numpy as np
+import pytest
+from combination import combination_count, get_combination_index
+from fair_value import FAIR_METHODS, fair_values, place_count
+
+def _brute_force(p, method, field_size, places):
+    # 逐一列舉前四名的每個次序, 以 Harville 概率累加到每個投注類型的組合
+    horses = [horse for horse in range(1, field_size + 1) if p[horse - 1] > 0]
+    index = get_combination_index(method, field_size)
+    labels = {tuple(combo): i for i, combo in enumerate(index.runners.tolist())}
+    probs = np.zeros(len(index))
+    depth = min(4, len(horses))
+    for order in permutations(horses, depth):
+        prob, used = 1.0, 0.0
+        for horse in order:
+            prob *= p[horse - 1] / (1.0 - used)
+            used += p[horse - 1]
+        if method == "WIN":
+            keys = [(order[0],)]
+        elif method == "PLA":
+            keys = [(horse,) for horse in order[:places]]
+        elif method == "QIN":
+            keys = [tuple(sorted(order[:2]))]
+        elif method == "QPL":
+            keys = [tuple(sorted(pair)) for pair in permutations(order[:places], 2) if pair[0] < pair[1]]
+        elif method == "FCT":
+            keys = [order[:2]]
+        elif method == "TRI":
+            keys = [tuple(sorted(order[:3]))] if depth >= 3 else []
+        else:
+            keys = [tuple(sorted(order[:4]))] if depth >= 4 else []
+        for key in keys:
+            probs[labels[key]] += prob
+    return probs
+
+def _odds(field_size, scratched, seed=0):
+    # 獨贏賠率含 20% 抽佣; 其他投注類型的市場賠率只影響 overround
+    rng = np.random.default_rng(seed)
+    p = rng.dirichlet(np.full(field_size, 2.0))
+    p[[horse - 1 for horse in scratched]] = 0.0
+    p /= p.sum()
+    with np.errstate(divide="ignore"):
+        odds = {"WIN": 0.8 / p}
+    for method in FAIR_METHODS[1:]:
+        odds[method] = np.full(combination_count(method, field_size), 10.0)
+    return p, odds
+
+@pytest.mark.parametrize("field_size, scratched", [(8, ()), (7, ()), (7, (3,)), (10, (2, 9)), (5, ())])
+def test_fair_values_match_enumeration(field_size, scratched):
+    p, odds = _odds(field_size, scratched)
+    fair, overround = fair_values(odds, FAIR_METHODS)
+    places = place_count(field_size - len(scratched))
+    for method in FAIR_METHODS:
+        expected = _brute_force(p, method, field_size, places)
+        with np.errstate(divide="ignore"):
+            np.testing.assert_allclose(fair[method], 1.0 / expected, rtol=1e-9, err_msg=method)
+    np.testing.assert_allclose(overround["WIN"], 1.0 / 0.8)
+    np.testing.assert_allclose(overround["PLA"], 0.1 * field_size / places)
+
+def test_scratching_reduces_places():
+    # 7 匹馬其中 1 匹退出: 只派前兩名, 位置概率總和為 2
+    p, odds = _odds(7, (4,))
+    fair, _ = fair_values(odds, ["WIN", "PLA", "QPL"])
+    with np.errstate(divide="ignore"):
+        assert np.isclose((1.0 / fair["PLA"]).sum(), 2.0)
+        assert np.isclose((1.0 / fair["QPL"]).sum(), 1.0)
+    assert np.isinf(fair["PLA"][3])
+
+def test_missing_win_pool_returns_nothing():
+    _, odds = _odds(8, ())
+    del odds["WIN"]
+    assert fair_values(odds, FAIR_METHODS) == ({}, {})
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+import numpy as np
+from history_store import HistoryStore, history_nbytes
+from retention import RetentionPolicy
+from scheduler import chart_cutoffs
+
+START = datetime(2025, 1, 1, 12, 0)
+POST_TIME = START + timedelta(minutes=120)
+
+def _fill(store, minutes=125, seconds=20, columns=("1", "2", "3")):
+    # 每 20 秒一行, 跨越開跑前 25/5 分鐘; 數值為隨機整數方便比較
+    rng = np.random.default_rng(0)
+    store.set_marks(chart_cutoffs(POST_TIME))
+    times = [START + timedelta(seconds=seconds * i) for i in range(minutes * 60 // seconds)]
+    for time_now in times:
+        store.append(time_now, rng.integers(0, 100, len(columns)).astype(float), list(columns))
+    return times
+
+def _marked_rows(store):
+    rows = []
+    for cutoff in chart_cutoffs(POST_TIME):
+        before, after = store.row_before(cutoff), store.row_from(cutoff)
+        rows.append((before[0], before[1].tolist(), after[0], after[1].tolist()))
+    return rows
+
+def test_compact_downsamples_old_rows_and_keeps_marks():
+    store = HistoryStore()
+    _fill(store)
+    marked, last = _marked_rows(store), (store.last_time(), store.last().tolist())
+    before = POST_TIME - timedelta(minutes=30)
+    dropped = store.compact(before, interval=300)
+    assert dropped > 0
+    assert _marked_rows(store) == marked
+    assert (store.last_time(), store.last().tolist()) == last
+    old = store.index[store.index < np.datetime64(before)]
+    # 每 5 分鐘最多一行, 另加 T-25 前後保留的行
+    buckets = old.asi8 // int(300e9)
+    assert len(old) <= len(np.unique(buckets)) + 3
+    assert (np.diff(store.index.asi8) > 0).all()
+
+def test_compact_cumulative_keeps_window_sums():
+    store = HistoryStore(cumulative=True)
+    _fill(store)
+    cutoffs = chart_cutoffs(POST_TIME)
+    totals = store.window_sum(len(store))
+
+    def between(first, second):
+        # 兩個時間點之間的投注變動總和 (圖表的「改變」)
+        return store.frame().loc[(store.index >= first) & (store.index < second)].sum().to_numpy()
+
+    changes = between(*cutoffs)
+    store.compact(POST_TIME - timedelta(minutes=30), interval=300)
+    np.testing.assert_allclose(store.window_sum(len(store)), totals)
+    np.testing.assert_allclose(between(*cutoffs), changes)
+    store.compact(store.last_time(), None)
+    np.testing.assert_allclose(store.window_sum(len(store)), totals)
+
+def test_compact_snapshot_is_not_affected():
+    store = HistoryStore()
+    _fill(store)
+    view = store.snapshot()
+    values = view.values.copy()
+    store.compact(POST_TIME, interval=300)
+    np.testing.assert_array_equal(view.values, values)
+
+def _race(minutes=125):
+    history = {"odds_dict": {"WIN": HistoryStore()}}
+    _fill(history["odds_dict"]["WIN"], minutes)
+    return history
+
+def test_trim_evicts_finished_races_first():
+    race_history = {1: _race(), 2: _race(), 3: _race()}
+    post_times = {race_no: POST_TIME for race_no in race_history}
+    time_now = START + timedelta(minutes=125)
+    # 先降採樣, 再把上限設為剛好超出一個字節
+    policy = RetentionPolicy(budget=float("inf"))
+    total = policy.trim(race_history, time_now, post_times, lambda race_no: race_no == 2)
+    policy.budget = total - 1
+    policy.trim(race_history, time_now, post_times, lambda race_no: race_no == 2)
+    assert len(race_history[2]["odds_dict"]["WIN"]) < len(race_history[1]["odds_dict"]["WIN"])
+
+def test_trim_skips_races_released_meanwhile():
+    race_history = {1: _race(), 2: _race()}
+    post_times = {race_no: POST_TIME for race_no in race_history}
+
+    def race_finished(race_no):
+        # 模擬另一執行緒 (race_cache) 在 trim 期間釋放了第一場
+        race_history.pop(1, None)
+        return race_no == 1
+
+    total = RetentionPolicy(budget=0).trim(race_history, START + timedelta(minutes=125), post_times, race_finished)
+    assert list(race_history) == [2]
+    assert total == history_nbytes(race_history[2])
@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+import http_client
+from http_client import CircuitBreaker, FetchError, StaleCache
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    monkeypatch.setattr(http_client, "breaker", breaker)
+    return breaker
+
+def test_breaker_allows_one_probe(breaker):
+    breaker.record_failure()
+    assert breaker.allow() == "half-open"
+    assert breaker.allow() is None
+    breaker.record_success()
+    assert breaker.allow() == "closed"
+
+def test_cancelled_probe_does_not_keep_breaker_open(breaker, monkeypatch):
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    monkeypatch.setattr(http_client, "get_async_session", cancelled)
+    breaker.record_failure()
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(http_client._post_async("http://127.0.0.1:1/", {"query": "", "variables": {}}))
+    assert breaker.allow() == "half-open"
+
+def test_async_requests_fall_back_to_stale_response(monkeypatch):
+    monkeypatch.setattr(http_client, "stale_cache", StaleCache())
+    payload = {"query": "investment", "variables": {"date": "2025-01-01"}}
+    responses = [{"data": 1}, FetchError("HTTP 503", 503)]
+
+    async def post(url, payload):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(http_client, "_post_async", post)
+    assert asyncio.run(http_client.post_json_async("url", payload, stale_ok=True)) == {"data": 1}
+    assert asyncio.run(http_client.post_json_async("url", payload, stale_ok=True)) == {"data": 1}
+    responses.append(FetchError("HTTP 503", 503))
+    with pytest.raises(FetchError):
+        asyncio.run(http_client.post_json_async("url", payload))
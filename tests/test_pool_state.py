@@ -0,0 +1,58 @@
+import numpy as np
+from pool_state import RacePoolState
+
+METHODS = ["WIN", "QIN"]
+
+def _states(win=("t1", "START_SELL"), qin=("t1", "START_SELL")):
+    return {"WIN": (win[0], "SELLING", win[1]), "QIN": (qin[0], "SELLING", qin[1])}
+
+def _odds(win=(2.0, 3.0, 5.0), qin=(8.0, 9.0, 10.0)):
+    return {"WIN": np.array(win), "QIN": np.array(qin)}
+
+def test_unchanged_pools_are_skipped():
+    state = RacePoolState()
+    assert state.changed_methods(_states(), METHODS) == METHODS
+    state.merge_odds(_odds(), METHODS)
+    assert state.changed_methods(_states(), METHODS) == []
+    assert state.changed_methods(_states(qin=("t2", "START_SELL")), METHODS) == ["QIN"]
+    assert state.field_size == 3
+
+def test_failed_fetch_is_requested_again():
+    state = RacePoolState()
+    state.changed_methods(_states(), METHODS)
+    state.merge_odds(None, METHODS)
+    assert state.changed_methods(_states(), METHODS) == METHODS
+
+def test_suspended_pool_keeps_polling():
+    state = RacePoolState()
+    state.changed_methods(_states(), METHODS)
+    state.merge_odds(_odds(), METHODS)
+    suspended = _states(win=("t2", "SUSPENDED"), qin=("t1", "SUSPENDED"))
+    assert state.changed_methods(suspended, METHODS) == ["WIN"]
+    state.merge_odds(_odds(), ["WIN"])
+    assert state.changed_methods(suspended, METHODS) == []
+    assert not state.closed and not state.finished
+    assert state.changed_methods(_states(win=("t3", "START_SELL")), METHODS) == ["WIN"]
+
+def test_stopped_pools_close_after_final_odds():
+    state = RacePoolState()
+    state.changed_methods(_states(), METHODS)
+    state.merge_odds(_odds(), METHODS)
+    stopped = _states(win=("t2", "STOP_SELL"), qin=("t1", "STOP_SELL"))
+    # QIN 沒有更新, 手上的已是最後賠率; WIN 先抓取最後賠率
+    assert state.changed_methods(stopped, METHODS) == ["WIN"]
+    assert state.closed == {"QIN"}
+    state.merge_odds(_odds(win=(2.1, 3.0, 4.8)), ["WIN"])
+    assert state.finished
+    assert state.changed_methods(stopped, METHODS) == []
+
+def test_pool_without_nodes_closes_on_sell_status():
+    state = RacePoolState()
+    state.changed_methods(_states(), METHODS)
+    state.merge_odds({"WIN": np.array([2.0, 3.0, 5.0]), "QIN": np.array([])}, METHODS)
+    assert "QIN" not in state.odds
+    # 沒有賠率節點的投注池不會每個 tick 重新請求
+    assert state.changed_methods(_states(), METHODS) == []
+    stopped = _states(win=("t1", "STOP_SELL"), qin=("t1", "STOP_SELL"))
+    state.changed_methods(stopped, METHODS)
+    assert state.finished
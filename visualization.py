@@ -1,139 +1,140 @@
 # visualization.py
-import streamlit as st
-import altair as alt
-import pandas as pd
 import numpy as np
-from datetime import timedelta
-import logging
-
-# Set up logging
-logging.basicConfig(filename='app.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
+import threading
+from collections import OrderedDict
 from config import (
     VENUE_OPTIONS, RACE_NUMBERS, METHOD_LIST_WITH_QPL, METHOD_LIST_WITHOUT_QPL,
-    METHOD_CH_WITH_QPL, METHOD_CH_WITHOUT_QPL, PRINT_LIST_WITH_QPL, PRINT_LIST_WITHOUT_QPL, BENCHMARK_DICT
+    METHOD_CH_WITH_QPL, METHOD_CH_WITHOUT_QPL, PRINT_LIST_WITH_QPL, PRINT_LIST_WITHOUT_QPL, BENCHMARK_DICT,
+    CHANGE_WINDOW, CHART_CACHE_SIZE
 )
+from scheduler import chart_cutoffs
 
-def print_bar_chart(
-    time_now, overall_investment_dict, odds_dict, method, race_no,
-    numbered_dict, post_time_dict, diff_dict=None
-):
-    # Get the cutoff/post time for the race
-    post_time = post_time_dict[race_no]
-    time_25_minutes_before = np.datetime64(post_time - timedelta(minutes=25) + timedelta(hours=8))
-    time_5_minutes_before = np.datetime64(post_time - timedelta(minutes=5) + timedelta(hours=8))
-  
-    for method in PRINT_LIST_WITH_QPL:
-      odds_list = pd.DataFrame()
-      df = pd.DataFrame()
-      if method == 'overall':
-          df = overall_investment_dict[method]
-          change_data = diff_dict[method].iloc[-1]
-      elif method in METHOD_LIST_WITH_QPL:
-          df = overall_investment_dict[method]
-          change_data = diff_dict[method].tail(10).sum(axis = 0)
-          odds_list = odds_dict[method].tail(1)
-      if df.tail(1).sum(axis=1)[0]==0:
-        continue
-      fig, ax1 = plt.subplots(figsize=(12, 6))
-      df.index = pd.to_datetime(df.index)
-      df_1st = pd.DataFrame()
-      df_1st_2nd = pd.DataFrame()
-      df_2nd = pd.DataFrame()
-      #df_3rd = pd.DataFrame()
-      df_1st = df[df.index< time_25_minutes_before].tail(1)
-      df_1st_2nd = df[df.index >= time_25_minutes_before].head(1)
-      df_2nd = df[df.index >= time_25_minutes_before].tail(1)
-      df_3rd = df[df.index>= time_5_minutes_before].tail(1)
+def _odds_label(odds, horse):
+    # 柱上顯示的賠率, 退出為 SCR
+    if horse > len(odds) or np.isnan(odds[horse - 1]):
+        return ""
+    return "SCR" if np.isinf(odds[horse - 1]) else f"{odds[horse - 1]:g}"
 
-      change_df = pd.DataFrame([change_data.apply(lambda x: x*4 if x > 0 else x*2)],columns=change_data.index,index =[df.index[-1]])
-      print(change_df)
-      if method in ['WIN', 'PLA']:
-        odds_list.index = pd.to_datetime(odds_list.index)
-        odds_1st = odds_list[odds_list.index< time_25_minutes_before].tail(1)
-        odds_2nd = odds_list[odds_list.index >= time_25_minutes_before].tail(1)
-        #odds_3rd = odds_list[odds_list.index>= time_5_minutes_before].tail(1)
+CHART_TITLES = dict(zip(METHOD_LIST_WITH_QPL, METHOD_CH_WITH_QPL), overall="綜合")
 
-      bars_1st = None
-      bars_2nd = None
-      #bars_3rd = None
-      # Initialize data_df
-      if not df_1st.empty:
-          data_df = df_1st
-          data_df = data_df._append(df_2nd)
-      elif not df_1st_2nd.empty:
-          data_df = df_1st_2nd
-          if not df_2nd.empty and not df_2nd.equals(df_1st_2nd):  # Avoid appending identical df_2nd
-              data_df = data_df._append(df_2nd)
-      else:
-          data_df = pd.DataFrame()  # Fallback if both are empty
-      #final_data_df = data_df._append(df_3rd)
-      final_data_df = data_df
-      sorted_final_data_df = final_data_df.sort_values(by=final_data_df.index[0], axis=1, ascending=False)
-      diff = sorted_final_data_df.diff().dropna()
-      diff[diff < 0] = 0
-      X = sorted_final_data_df.columns
-      X_axis = np.arange(len(X))
-      sorted_change_df = change_df[X]
-      if df_3rd.empty:
-                  bar_colour = 'blue'
-      else:
-                  bar_colour = 'red'
-      if not df_1st.empty:
-          if df_2nd.empty:
-                bars_1st = ax1.bar(X_axis, sorted_final_data_df.iloc[0], 0.4, label='投注額', color='pink')
-          else:
-                bars_2nd = ax1.bar(X_axis - 0.2, sorted_final_data_df.iloc[1], 0.4, label='25分鐘', color=bar_colour)
-                bar = ax1.bar(X_axis+0.2,sorted_change_df.iloc[0],0.4,label='改變',color='grey')
-                #if not df_3rd.empty:
-                    #bars_3rd = ax1.bar(X_axis, diff.iloc[0], 0.3, label='5分鐘', color='red')
-      else:
-            if df_2nd.equals(df_1st_2nd):
-              bars_2nd = ax1.bar(X_axis - 0.2, sorted_final_data_df.iloc[0], 0.4, label='25分鐘', color=bar_colour)
-            else:
-                bars_2nd = ax1.bar(X_axis - 0.2, sorted_final_data_df.iloc[1], 0.4, label='25分鐘', color=bar_colour)
-                bar = ax1.bar(X_axis+0.2,sorted_change_df.iloc[0],0.4,label='改變',color='grey')
-                #if not df_3rd.empty:
-                    #bars_3rd = ax1.bar(X_axis, diff.iloc[0], 0.3, label='5分鐘', color='red')
-            #else:
-                #bars_3rd = ax1.bar(X_axis-0.2, sorted_final_data_df.iloc[0], 0.4, label='5分鐘', color='red')
-                #bar = ax1.bar(X_axis+0.2,sorted_change_df.iloc[0],0.4,label='改變',color='grey')
+def chart_data(overall_store, odds_store, diff_store, method, time_25_minutes_before, time_5_minutes_before, names):
+    # 每匹馬最多兩行 (投注額, 改變) 的精簡 records, 按開跑前 25 分鐘 (沒有則最早) 的投注額由大到小排列
+    # 返回 (records, 投注額的類別名稱, 顏色); 沒有投注額時返回 None
+    if overall_store.empty:
+        return None
+    latest_time, latest = overall_store.last_time(), overall_store.last()
+    if not np.nansum(latest):
+        return None
+    reference = overall_store.row_before(time_25_minutes_before) or overall_store.row_from(time_25_minutes_before)
+    if reference is None:
+        reference = (latest_time, latest)
+    after_25 = latest_time >= time_25_minutes_before
+    series = "25分鐘" if after_25 else "投注額"
+    colour = "red" if latest_time >= time_5_minutes_before else "blue" if after_25 else "pink"
+    order = np.argsort(-np.nan_to_num(reference[1]), kind="stable")
+    horses = np.asarray(overall_store.columns)[order]
+    labels = [names[horse - 1] if horse <= len(names) else str(horse) for horse in horses]
+    values = np.round(np.nan_to_num(latest[order]), 2)
+    if method in ["WIN", "PLA"] and odds_store is not None and not odds_store.empty:
+        odds_text = [_odds_label(odds_store.last(), horse) for horse in horses]
+    else:
+        odds_text = [""] * len(horses)
+    data = [{"horse": label, "series": series, "value": value, "odds": text}
+            for label, value, text in zip(labels, values.tolist(), odds_text)]
+    # 開跑前 25 分鐘後有多於一個快照時加上「改變」(正數 x4, 負數 x2)
+    if after_25 and reference[0] != latest_time and diff_store is not None and not diff_store.empty:
+        change = diff_store.last() if method == "overall" else diff_store.window_sum(CHANGE_WINDOW)
+        positions = diff_store.columns.get_indexer(horses)
+        change = np.where(positions >= 0, change[positions], 0.0)
+        change = np.where(change > 0, change * 4, change * 2)
+        data += [{"horse": label, "series": "改變", "value": value, "odds": ""}
+                 for label, value in zip(labels, change.tolist())]
+    return data, series, colour
 
-      # Add numbers above bars
-      if method in ['WIN', 'PLA']:
-        if bars_2nd is not None:
-          sorted_odds_list_2nd = odds_2nd[X].iloc[0]
-          for bar, odds in zip(bars_2nd, sorted_odds_list_2nd):
-              yval = bar.get_height()
-              ax1.text(bar.get_x() + bar.get_width() / 2, yval, odds, ha='center', va='bottom')
-        #if bars_3rd is not None:
-          #sorted_odds_list_3rd = odds_3rd[X].iloc[0]
-          #for bar, odds in zip(bars_3rd, sorted_odds_list_3rd):
-               # yval = bar.get_height()
-                #ax1.text(bar.get_x() + bar.get_width() / 2, yval, odds, ha='center', va='bottom')
-        elif bars_1st is not None:
-          sorted_odds_list_1st = odds_1st[X].iloc[0]
-          for bar, odds in zip(bars_1st, sorted_odds_list_1st):
-              yval = bar.get_height()
-              ax1.text(bar.get_x() + bar.get_width() / 2, yval, odds, ha='center', va='bottom')
+def chart_spec(data, series, colour, title):
+    # 直接組成 Vega-Lite spec (dict), 數據以 records 內嵌, 每匹馬最多兩條柱
+    # (經 altair 建立再 to_dict 每個圖表要數十毫秒)
+    x = {"field": "horse", "type": "nominal", "sort": None, "title": None, "axis": {"labelAngle": 0}}
+    x_offset = {"field": "series", "type": "nominal", "sort": [series, "改變"]}
+    return {
+        "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+        "title": title,
+        "height": 360,
+        "data": {"values": data},
+        "layer": [
+            {
+                "mark": {"type": "bar"},
+                "encoding": {
+                    "x": x,
+                    "xOffset": x_offset,
+                    "y": {"field": "value", "type": "quantitative", "title": "投注額"},
+                    "color": {
+                        "field": "series", "type": "nominal", "title": None,
+                        "scale": {"domain": [series, "改變"], "range": [colour, "grey"]},
+                        "legend": {"orient": "top"},
+                    },
+                    "tooltip": [
+                        {"field": "horse", "type": "nominal", "title": "馬匹"},
+                        {"field": "series", "type": "nominal", "title": "類別"},
+                        {"field": "value", "type": "quantitative", "title": "數值"},
+                    ],
+                },
+            },
+            {
+                "mark": {"type": "text", "dy": -6},
+                "transform": [{"filter": "datum.odds != ''"}],
+                "encoding": {
+                    "x": x,
+                    "xOffset": x_offset,
+                    "y": {"field": "value", "type": "quantitative"},
+                    "text": {"field": "odds", "type": "nominal"},
+                },
+            },
+        ],
+    }
 
-      namelist_sort = [numbered_dict[race_no][i - 1] for i in X]
-      formatted_namelist = [label.split('.')[0] + '.' + '\n'.join(label.split('.')[1]) for label in namelist_sort]
-      plt.xticks(X_axis, formatted_namelist, fontsize=12)
-      ax1.grid(color='lightgrey', axis='y', linestyle='--')
-      ax1.set_ylabel('投注額',fontsize=15)
-      ax1.tick_params(axis='y')
-      fig.legend()
+# 圖表 spec 按 (日期, 場地, 場次, 投注類型, 最後一個 tick, 開跑時間, 馬名) 快取, 所有 rerun 及 session 共用
+# 沒有新數據時直接重用, 不重新計算或序列化
+_chart_cache = OrderedDict()
+_chart_lock = threading.Lock()
+
+def cached_chart_spec(key, build):
+    with _chart_lock:
+        spec = _chart_cache.get(key)
+        if spec is not None:
+            _chart_cache.move_to_end(key)
+            return spec
+    spec = build()
+    with _chart_lock:
+        _chart_cache[key] = spec
+        while len(_chart_cache) > CHART_CACHE_SIZE:
+            _chart_cache.popitem(last=False)
+    return spec
+
+def print_bar_chart(
+    time_now, overall_investment_dict, odds_dict, method, race_no,
+    numbered_dict, post_time_dict, diff_dict=None, Date=None, place=None
+):
+    # 只畫 method 一個圖表; 呼叫者自行按投注類型迴圈
+    store = overall_investment_dict[method]
+    if store.empty:
+        return
+    post_time = post_time_dict[race_no]
+    names = tuple(numbered_dict.get(race_no, []))
+    key = (str(Date), place, race_no, method, int(store.last_time().astype(np.int64)), len(store), post_time, names)
 
-      if method == 'overall':
-          plt.title('綜合', fontsize=15)
-      elif method == 'QIN':
-          plt.title('連贏', fontsize=15)
-      elif method == 'QPL':
-          plt.title('位置Q', fontsize=15)
-      elif method == 'WIN':
-          plt.title('獨贏', fontsize=15)
-      elif method == 'PLA':
-          plt.title('位置', fontsize=15)
-      st.pyplot(fig)
+    def build():
+        time_25_minutes_before, time_5_minutes_before = chart_cutoffs(post_time)
+        prepared = chart_data(
+            store, odds_dict.get(method), (diff_dict or {}).get(method), method,
+            time_25_minutes_before, time_5_minutes_before, names,
+        )
+        if prepared is None:
+            return {}
+        return chart_spec(*prepared, CHART_TITLES.get(method, method))
 
+    spec = cached_chart_spec(key, build)
+    if spec:
+        # 只在畫圖時才需要 Streamlit, benchmark.py 等可以不載入它而使用 chart_data/chart_spec
+        import streamlit as st
+        st.vega_lite_chart(spec)